@@ -0,0 +1,91 @@
+"""
+Batch evaluation of many positions at once with NumPy, for offline analysis and
+training-data generation (the search itself keeps using chess_engine.evaluate_board).
+
+Positions are int8 arrays in one of two layouts, squares numbered i*8+j as in chess_engine:
+  (N, 64)      piece codes: 0 for an empty square, 1 + PIECE_NAMES.index(piece) otherwise
+  (N, 12, 64)  one plane per piece in PIECE_NAMES order, 1 where that piece stands
+evaluate_batch() returns the material + center-control score of each position, the same
+number as chess_engine.material_score (evaluate_board with EVAL_MOBILITY off); mobility
+and king safety need move generation and are not part of it.
+
+Needs NumPy (pip install numpy); chess_engine does not.
+
+    python batch_eval.py positions.fen          # one FEN per line -> "score fen" lines
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from chess_engine import PIECE_NAMES, PIECE_SQUARE, board_from_fen, material_score
+
+PIECE_CODES = {p: n + 1 for n, p in enumerate(PIECE_NAMES)}
+PIECE_CODES['  '] = 0
+
+# row = piece code, column = square; row 0 (empty) scores nothing
+SCORE_TABLE = np.zeros((len(PIECE_NAMES) + 1, 64))
+for _p, _code in PIECE_CODES.items():
+    if _code:
+        SCORE_TABLE[_code] = PIECE_SQUARE[_p]
+
+
+def encode_boards(boards):
+    """List boards (8x8 lists of 'wP'-style strings) -> (N, 64) int8 piece codes."""
+    codes = np.zeros((len(boards), 64), dtype=np.int8)
+    for n, temp_board in enumerate(boards):
+        codes[n] = [PIECE_CODES[p] for row in temp_board for p in row]
+    return codes
+
+
+def codes_to_planes(codes):
+    """(N, 64) piece codes -> (N, 12, 64) int8 piece planes."""
+    codes = np.asarray(codes)
+    pieces = np.arange(1, len(PIECE_NAMES) + 1, dtype=codes.dtype)
+    return (codes[:, None, :] == pieces[None, :, None]).astype(np.int8)
+
+
+def planes_to_codes(planes):
+    """(N, 12, 64) piece planes -> (N, 64) int8 piece codes."""
+    planes = np.asarray(planes)
+    pieces = np.arange(1, len(PIECE_NAMES) + 1, dtype=np.int8)
+    return np.einsum('npq,p->nq', planes.astype(np.int8), pieces).astype(np.int8)
+
+
+def evaluate_batch(positions):
+    """Material + center score (+ for White) per position, as a float64 array of length N."""
+    positions = np.asarray(positions)
+    if positions.ndim == 2 and positions.shape[1] == 64:
+        return SCORE_TABLE[positions.astype(np.intp), np.arange(64)].sum(axis=1)
+    if positions.ndim == 3 and positions.shape[1:] == (len(PIECE_NAMES), 64):
+        return positions.reshape(len(positions), -1).astype(np.float64) @ SCORE_TABLE[1:].ravel()
+    raise ValueError("expected an (N, 64) or (N, %d, 64) array, got shape %r"
+                     % (len(PIECE_NAMES), positions.shape))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="file with one FEN per line")
+    parser.add_argument("--check", action="store_true",
+                        help="also score every position with material_score and report the largest difference")
+    args = parser.parse_args(argv)
+
+    with open(args.source, encoding="utf-8") as f:
+        fens = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    boards = [board_from_fen(fen)[0] for fen in fens]
+    t = time.perf_counter()
+    scores = evaluate_batch(encode_boards(boards))
+    elapsed = time.perf_counter() - t
+    for score, fen in zip(scores, fens):
+        print("%.2f %s" % (score, fen))
+    print("%d positions in %.4fs" % (len(fens), elapsed), file=sys.stderr)
+    if args.check:
+        worst = max((abs(s - material_score(b)) for s, b in zip(scores, boards)), default=0.0)
+        print("largest difference from material_score: %g" % worst, file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
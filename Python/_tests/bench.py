@@ -0,0 +1,138 @@
+"""
+Search benchmark: run the Easy/Medium/Hard move choice on fixed positions and record the numbers.
+
+Runs chess_engine.choose_move (the call the GUI's ai_worker makes) headless on a fixed
+set of middlegame and endgame positions with Black to move, and writes nodes searched,
+nodes/sec, time to each iterative-deepening depth, TT hit rate and the chosen move to
+JSON, so two runs (before/after an evaluation or move-ordering change) can be compared.
+Easy and Medium's capture shortcut do no search and only report the move and time.
+
+    python bench.py                          # all positions, all difficulties -> bench.json
+    python bench.py --difficulty Hard --time 2 --processes 1
+    python bench.py --position kiwipete --output kiwipete.json
+    python bench.py --difficulty Hard --no-null-move --no-lmr --no-futility   # full-width search
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import chess_engine
+from chess_engine import board_from_fen, choose_move, move_name
+
+# name, phase, FEN (Black to move: the engine always plays Black)
+POSITIONS = [
+    ("open_e4", "middlegame", "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"),
+    ("italian", "middlegame", "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"),
+    ("kiwipete", "middlegame", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b KQkq - 0 1"),
+    ("position6", "middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 b - - 0 10"),
+    ("back_rank", "endgame", "6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1"),
+    ("rook_ending", "endgame", "8/8/4k3/8/2r5/8/4K3/5R2 b - - 0 1"),
+    ("kpk", "endgame", "8/5k2/8/8/8/8/4PK2/8 b - - 0 1"),
+    ("kqk", "endgame", "8/8/8/4k3/8/8/3QK3/8 b - - 0 1"),
+]
+
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+
+
+def run_one(name, phase, fen, difficulty):
+    """Choose Black's move in one position; return the result record."""
+    temp_board, _, rights, _ = board_from_fen(fen)
+    depths = []
+    t = time.perf_counter()
+    move = choose_move(temp_board, difficulty, rights, on_depth=depths.append)
+    elapsed = time.perf_counter() - t
+    last = depths[-1] if depths else None
+    return {
+        'position': name,
+        'phase': phase,
+        'difficulty': difficulty,
+        'move': move_name(move) if move[0] is not None else None,
+        'time': round(elapsed, 4),
+        'depth': last['depth'] if last else 0,
+        'score': round(last['score'], 4) if last else None,
+        'nodes': last['nodes'] if last else 0,
+        'nps': round(last['nodes'] / elapsed) if last and elapsed > 0 else 0,
+        'tt_hit_rate': round(last['tt_hit_rate'], 4) if last else None,
+        'depths': [{
+            'depth': d['depth'],
+            'time': round(d['time'], 4),
+            'nodes': d['nodes'],
+            'nps': round(d['nps']),
+            'score': round(d['score'], 4),
+            'move': move_name(d['move']) if d['move'] else None,
+            'pv': [move_name(m) for m in d['pv']],
+            'tt_hit_rate': round(d['tt_hit_rate'], 4),
+            'tt_fill': round(d['tt_fill'], 4),
+        } for d in depths],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--difficulty", action="append", choices=DIFFICULTIES,
+                        help="difficulty to run (repeatable; default all)")
+    parser.add_argument("--position", action="append", help="named position to run (repeatable; default all)")
+    parser.add_argument("--time", type=float, default=chess_engine.HARD_TIME_LIMIT,
+                        help="Hard time limit per move in seconds (default %(default)s)")
+    parser.add_argument("--max-depth", type=int, default=chess_engine.HARD_MAX_DEPTH,
+                        help="Hard maximum depth (default %(default)s)")
+    parser.add_argument("--processes", type=int, default=chess_engine.SEARCH_PROCESSES,
+                        help="root search processes for Hard (default %(default)s)")
+    parser.add_argument("--no-null-move", action="store_true", help="turn off null-move pruning")
+    parser.add_argument("--no-lmr", action="store_true", help="turn off late move reductions")
+    parser.add_argument("--no-futility", action="store_true", help="turn off futility pruning")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for Easy/Medium choices")
+    parser.add_argument("--output", default="bench.json", help="JSON file to write (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    chess_engine.HARD_TIME_LIMIT = args.time
+    chess_engine.HARD_MAX_DEPTH = args.max_depth
+    chess_engine.SEARCH_PROCESSES = max(1, args.processes)
+    chess_engine.USE_NULL_MOVE = chess_engine.USE_NULL_MOVE and not args.no_null_move
+    chess_engine.USE_LMR = chess_engine.USE_LMR and not args.no_lmr
+    chess_engine.USE_FUTILITY = chess_engine.USE_FUTILITY and not args.no_futility
+    random.seed(args.seed)
+
+    positions = [p for p in POSITIONS if not args.position or p[0] in args.position]
+    if not positions:
+        parser.error("no such position; choose from: " + ", ".join(p[0] for p in POSITIONS))
+    results = []
+    for name, phase, fen in positions:
+        for difficulty in args.difficulty or DIFFICULTIES:
+            r = run_one(name, phase, fen, difficulty)
+            results.append(r)
+            print("%-12s %-6s %-6s depth %d  nodes %9d  %7.2fs  %8d nps  tt hits %s"
+                  % (name, difficulty, r['move'], r['depth'], r['nodes'], r['time'], r['nps'],
+                     "%.1f%%" % (100 * r['tt_hit_rate']) if r['tt_hit_rate'] is not None else "-"))
+
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': {
+            'hard_time_limit': chess_engine.HARD_TIME_LIMIT,
+            'hard_max_depth': chess_engine.HARD_MAX_DEPTH,
+            'medium_depth': chess_engine.MEDIUM_DEPTH,
+            'search_processes': chess_engine.SEARCH_PROCESSES,
+            'use_quiescence': chess_engine.USE_QUIESCENCE,
+            'use_null_move': chess_engine.USE_NULL_MOVE,
+            'use_lmr': chess_engine.USE_LMR,
+            'use_futility': chess_engine.USE_FUTILITY,
+            'eval_mobility': chess_engine.EVAL_MOBILITY,
+            'tt_size_mb': chess_engine.TT_SIZE_MB,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("wrote", args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
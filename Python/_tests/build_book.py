@@ -0,0 +1,139 @@
+"""
+Build an opening book (see opening_book.py) from PGN games or a plain move list.
+
+A plain move list has one opening line per row, written in SAN ("e4 e5 Nf3 Nc6") or
+coordinate notation ("e2e4 e7e5"); move numbers are optional and '#' starts a comment.
+A .pgn file is split into games on result tokens; headers, comments, variations and NAGs
+are skipped. Every position reached in the first --plies plies adds 1 to the weight of
+the move played from it. A line stops early at a move the engine cannot play
+(en passant, underpromotion).
+
+    python build_book.py openings.txt                # -> book.bin
+    python build_book.py games.pgn --plies 20 --output big.bin
+"""
+
+import argparse
+import re
+import sys
+
+from chess_engine import (
+    initial_board, ALL_CASTLING, board_key, make_move, get_all_moves_for_player,
+    pack_move, parse_square,
+)
+from opening_book import write_book
+
+RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+COORD_PATTERN = re.compile(r"^([a-h][1-8])([a-h][1-8])([nbrq])?$")
+
+
+def parse_move(temp_board, side, rights, text):
+    """SAN or coordinate move text -> legal (start, end), or None if it is not a legal engine move."""
+    text = text.rstrip("+#!?")
+    legal = get_all_moves_for_player(temp_board, side, rights)
+    rank = 7 if side == 'w' else 0
+    if text in ("O-O", "0-0"):
+        return ((rank, 4), (rank, 6)) if ((rank, 4), (rank, 6)) in legal else None
+    if text in ("O-O-O", "0-0-0"):
+        return ((rank, 4), (rank, 2)) if ((rank, 4), (rank, 2)) in legal else None
+
+    m = COORD_PATTERN.match(text)
+    if m:
+        # promotions are always to a queen in the engine
+        if m.group(3) not in (None, 'q'):
+            return None
+        move = (parse_square(m.group(1)), parse_square(m.group(2)))
+        return move if move in legal else None
+
+    m = SAN_PATTERN.match(text)
+    if not m:
+        return None
+    kind, from_file, from_rank, target, promotion = m.groups()
+    if promotion not in (None, 'Q'):
+        return None
+    end = parse_square(target)
+    piece = side + (kind or 'P')
+    candidates = [
+        (start, e) for start, e in legal
+        if e == end and temp_board[start[0]][start[1]] == piece
+        and (from_file is None or start[1] == 'abcdefgh'.index(from_file))
+        and (from_rank is None or start[0] == 8 - int(from_rank))
+    ]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def pgn_games(text):
+    """Move-token lists, one per game, from PGN text."""
+    text = re.sub(r"\[[^\]]*\]", " ", text)       # headers
+    text = re.sub(r"\{[^}]*\}", " ", text)        # comments
+    text = re.sub(r";[^\n]*", " ", text)          # rest-of-line comments
+    while re.search(r"\([^()]*\)", text):         # variations, innermost first
+        text = re.sub(r"\([^()]*\)", " ", text)
+    games, tokens = [], []
+    for token in text.split():
+        if token in RESULTS:
+            games.append(tokens)
+            tokens = []
+        elif not token.startswith("$"):
+            tokens.append(token)
+    if tokens:
+        games.append(tokens)
+    return games
+
+
+def move_list_games(text):
+    """Move-token lists, one per non-empty line of a plain move list."""
+    games = []
+    for line in text.splitlines():
+        tokens = line.split("#", 1)[0].split()
+        if tokens:
+            games.append(tokens)
+    return games
+
+
+def add_game(entries, tokens, plies):
+    """Play one game's tokens from the start position, counting (key, move) pairs.
+       Returns the token that could not be played, or None."""
+    temp_board = [row[:] for row in initial_board]
+    rights = dict(ALL_CASTLING)
+    side = 'w'
+    key = board_key(temp_board, side, rights)
+    played = 0
+    for token in tokens:
+        token = re.sub(r"^\d+\.+", "", token)    # "1.e4" / "1..." move numbers
+        if not token:
+            continue
+        if played >= plies:
+            break
+        move = parse_move(temp_board, side, rights, token)
+        if move is None:
+            return token
+        entries[(key, pack_move(move))] = entries.get((key, pack_move(move)), 0) + 1
+        key = make_move(move[0], move[1], temp_board, rights, key)[-1]
+        side = 'b' if side == 'w' else 'w'
+        played += 1
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="PGN file (.pgn) or plain move list")
+    parser.add_argument("--plies", type=int, default=16, help="book depth in plies (default %(default)s)")
+    parser.add_argument("--output", default="book.bin", help="book file to write (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    with open(args.source, encoding="utf-8") as f:
+        text = f.read()
+    games = pgn_games(text) if args.source.lower().endswith(".pgn") else move_list_games(text)
+    entries = {}
+    for n, tokens in enumerate(games, 1):
+        bad = add_game(entries, tokens, args.plies)
+        if bad is not None:
+            print("game %d: stopped at %r (illegal or not playable by the engine)" % (n, bad), file=sys.stderr)
+    write_book(entries, args.output)
+    print("%d games, %d positions/moves -> %s" % (len(games), len(entries), args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
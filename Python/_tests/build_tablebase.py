@@ -0,0 +1,182 @@
+"""
+Generate the KQK, KRK and KPK tablebases (see tablebase.py) by retrograde analysis.
+
+One forward pass runs chess_engine's own move generator (bitboard backend) on every
+legal placement to record each position's successors. Moves that leave the table are
+resolved right away: a capture leaves bare kings (draw), and a KPK promotion is looked
+up in the KQK table built before it. Then the results are propagated backwards from
+the checkmates, one ply at a time. A position is lost once every move leads to a
+position the opponent wins, and won as soon as one move leads to a lost position.
+Whatever is never resolved is a draw.
+
+    python build_tablebase.py                    # all tables -> tables/
+    python build_tablebase.py --table KRK --output /tmp/tb
+"""
+
+import argparse
+import os
+import sys
+import time
+from array import array
+
+from chess_engine import BitboardPosition, get_all_moves_for_player, is_check
+from tablebase import (
+    MATERIALS, TABLE_SIZE, WDL_DRAW, WDL_WIN, WDL_LOSS, WDL_ILLEGAL, DTM_NONE,
+    table_index, decode_index, write_table, table_paths, Tablebases,
+)
+
+UNRESOLVED = 254   # dtm placeholder while generating
+
+
+def is_legal_placement(strong_to_move, sk, wk, ps, piece):
+    """Distinct squares, kings not touching, no pawn on the first or last rank.
+       (The side not to move being in check is ruled out by the engine afterwards.)"""
+    if sk == wk or ps == sk or ps == wk:
+        return False
+    if abs((sk >> 3) - (wk >> 3)) <= 1 and abs((sk & 7) - (wk & 7)) <= 1:
+        return False
+    if piece == 'P' and (ps >> 3) in (0, 7):
+        return False
+    return True
+
+
+def generate(material, tables, log=print):
+    """
+    Retrograde analysis for one material signature (White strong).
+    tables: Tablebases with the tables this one can convert into (KQK for KPK).
+    Returns (wdl, dtm) as bytearrays with one value per table index.
+    """
+    piece = material[1]
+    wdl = bytearray([WDL_ILLEGAL]) * TABLE_SIZE
+    dtm = bytearray([DTM_NONE]) * TABLE_SIZE
+    remaining = array('H', bytes(2 * TABLE_SIZE))   # moves not yet known to lose for the mover
+    escapes = bytearray(TABLE_SIZE)                  # 1 if a move leaves the table for a draw
+    # per-ply events: positions newly lost / candidate wins / outside moves that lose
+    lost_at, win_at, worse_at = {}, {}, {}
+    succ_from = array('I')
+    succ_to = array('I')
+
+    temp_board = [['  '] * 8 for _ in range(8)]
+    pos = BitboardPosition()
+    started = time.time()
+    for index in range(TABLE_SIZE):
+        strong_to_move, sk, wk, ps = decode_index(index)
+        if not is_legal_placement(strong_to_move, sk, wk, ps, piece):
+            continue
+        temp_board[sk >> 3][sk & 7] = 'wK'
+        temp_board[wk >> 3][wk & 7] = 'bK'
+        temp_board[ps >> 3][ps & 7] = 'w' + piece
+        pos.load(temp_board)
+        temp_board[sk >> 3][sk & 7] = temp_board[wk >> 3][wk & 7] = temp_board[ps >> 3][ps & 7] = '  '
+
+        mover, waiting = ('w', 'b') if strong_to_move else ('b', 'w')
+        if is_check(waiting, pos):
+            continue
+        wdl[index] = WDL_DRAW
+        moves = get_all_moves_for_player(pos, mover)
+        if not moves:
+            if is_check(mover, pos):
+                lost_at.setdefault(0, []).append(index)
+                dtm[index] = UNRESOLVED
+            continue
+        dtm[index] = UNRESOLVED
+        remaining[index] = len(moves)
+        for (si, sj), (ei, ej) in moves:
+            start, end = si*8 + sj, ei*8 + ej
+            if strong_to_move:
+                if start == ps and piece == 'P' and ei == 0:
+                    # promotion (always to a queen): look the result up in KQK
+                    found = tables.probe_index('KQK', table_index(False, sk, wk, end))
+                    if found is None:
+                        raise RuntimeError("KPK needs the KQK table; build it first")
+                    child_wdl, child_dtm = found
+                    if child_wdl == WDL_LOSS:
+                        win_at.setdefault(child_dtm + 1, []).append(index)
+                    elif child_wdl == WDL_WIN:
+                        worse_at.setdefault(child_dtm, []).append(index)
+                    else:
+                        escapes[index] = 1
+                    continue
+                child = table_index(False, end if start == sk else sk, wk, end if start == ps else ps)
+            else:
+                if end == ps:
+                    escapes[index] = 1    # piece captured: bare kings
+                    continue
+                child = table_index(True, sk, end, ps)
+            succ_from.append(index)
+            succ_to.append(child)
+    log("%s: forward pass %d moves in %.1fs" % (material, len(succ_to), time.time() - started))
+
+    # predecessor lists (compressed: preds[pred_start[c]:pred_start[c+1]] lead to c)
+    pred_start = array('I', bytes(4 * (TABLE_SIZE + 1)))
+    for child in succ_to:
+        pred_start[child + 1] += 1
+    for c in range(TABLE_SIZE):
+        pred_start[c + 1] += pred_start[c]
+    fill = array('I', pred_start)
+    preds = array('I', bytes(4 * len(succ_to)))
+    for parent, child in zip(succ_from, succ_to):
+        preds[fill[child]] = parent
+        fill[child] += 1
+    del succ_from, succ_to, fill
+
+    def lose_one_move(index, ply):
+        remaining[index] -= 1
+        if remaining[index] == 0 and not escapes[index]:
+            lost_at.setdefault(ply + 1, []).append(index)
+
+    ply = 0
+    while ply < UNRESOLVED and (lost_at or win_at or worse_at):
+        for index in lost_at.pop(ply, ()):
+            if dtm[index] != UNRESOLVED:
+                continue
+            wdl[index], dtm[index] = WDL_LOSS, ply
+            for parent in preds[pred_start[index]:pred_start[index + 1]]:
+                if dtm[parent] == UNRESOLVED:
+                    win_at.setdefault(ply + 1, []).append(parent)
+        for index in win_at.pop(ply, ()):
+            if dtm[index] != UNRESOLVED:
+                continue
+            wdl[index], dtm[index] = WDL_WIN, ply
+            for parent in preds[pred_start[index]:pred_start[index + 1]]:
+                if dtm[parent] == UNRESOLVED:
+                    lose_one_move(parent, ply)
+        for index in worse_at.pop(ply, ()):
+            if dtm[index] == UNRESOLVED:
+                lose_one_move(index, ply)
+        ply += 1
+
+    for index in range(TABLE_SIZE):
+        if dtm[index] == UNRESOLVED:
+            dtm[index] = DTM_NONE
+    counts = [wdl.count(v) for v in (WDL_WIN, WDL_DRAW, WDL_LOSS)]
+    log("%s: %d won, %d drawn, %d lost for the side to move, longest mate %d plies, %.1fs total"
+        % (material, counts[0], counts[1], counts[2], max(d for d in dtm if d != DTM_NONE),
+           time.time() - started))
+    return wdl, dtm
+
+
+def main(argv=None):
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tables")
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--table", action="append", choices=MATERIALS,
+                        help="table to build (repeatable; default all)")
+    parser.add_argument("--output", default=default_dir, help="directory for the table files (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    wanted = args.table or list(MATERIALS)
+    if 'KPK' in wanted and 'KQK' not in wanted and not os.path.exists(table_paths(args.output, 'KQK')[0]):
+        wanted.insert(0, 'KQK')
+    for material in MATERIALS:
+        if material in wanted:
+            tables = Tablebases(args.output)
+            try:
+                wdl, dtm = generate(material, tables)
+            finally:
+                tables.close()
+            write_table(args.output, material, wdl, dtm)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2203 @@
+"""
+Chess engine: rules, move generation, evaluation and search, with no Tkinter dependency.
+
+Positions are lists of 8 rows of two-character strings ('wP', 'bK', '  ' for empty),
+row 0 being Black's back rank. Castling rights are dicts like {'wK': True, 'wQ': True,
+'bK': True, 'bQ': True}; functions that take rights=None assume no castling is allowed.
+The GUI (test.py) imports this module; it is equally usable headless, e.g.
+
+    import chess_engine
+    start, end = chess_engine.choose_move(chess_engine.initial_board, 'Hard', dict(chess_engine.ALL_CASTLING))
+"""
+import random
+import time
+import sys
+import os
+import threading
+import struct
+from array import array
+
+from tablebase import Tablebases, WDL_WIN, WDL_LOSS
+
+# ----------------------------
+# Config
+# ----------------------------
+HARD_TIME_LIMIT = 6.0   # seconds for Hard AI per move without a game clock (increase to make it stronger)
+TIME_STABLE_DEPTHS = 3  # Hard stops early once the best move is the same for this many depths in a row,
+TIME_STABLE_SHARE = 0.4  # ...but only after this share of its time budget has been used
+TIME_SCORE_DROP = 0.3   # a score this much worse than the previous depth...
+TIME_EXTEND_FACTOR = 2.0  # ...lets the search run up to this multiple of its normal time
+TIME_MOVES_TO_GO = 30   # with a game clock, the remaining time is spread over this many moves
+HARD_MAX_DEPTH = 6      # maximum depth to attempt with iterative deepening
+ASPIRATION_WINDOW = 0.25  # Hard searches each depth after the first in this window around the previous score...
+ASPIRATION_GROWTH = 4   # ...and on a fail widens the failing side this many times further (full width past 9)
+MEDIUM_DEPTH = 3        # medium ply depth fallback (quiescence resolves exchanges past it)
+USE_QUIESCENCE = True   # extend leaves with a captures/promotions-only search
+USE_NULL_MOVE = True    # null-move pruning: skip a turn, and a reduced search that still beats beta cuts off
+NULL_MOVE_R = 2         # depth reduction of the null-move search (on top of the skipped ply)
+USE_LMR = True          # late move reductions: quiet moves late in the order are searched one ply shallower first
+LMR_MIN_DEPTH = 3       # only reduce at this remaining depth or more...
+LMR_MIN_MOVE = 3        # ...and from this move (0-based, in search order) on
+USE_FUTILITY = True     # futility pruning: at depth 1, skip quiet moves that cannot lift the eval to alpha
+FUTILITY_MARGIN = 1.0   # the most a quiet move is assumed to gain at depth 1 (a pawn)
+TT_SIZE_MB = 16         # transposition table budget (fixed, does not grow during a game)
+EVAL_MOBILITY = True    # mobility + king safety at the leaves (False = material/center only)
+SEARCH_POLL_CALLS = 256  # searches read the clock and their cancel token once per this many node/move checks
+SEARCH_PROCESSES = min(8, os.cpu_count() or 1)  # Hard splits root moves over this many processes (1 = in-thread)
+USE_TABLEBASES = True   # probe KQK/KRK/KPK tables (build them with build_tablebase.py) when present
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tables")
+# ----------------------------
+
+PIECE_NAMES = ['wP','wN','wB','wR','wQ','wK','bP','bN','bB','bR','bQ','bK']
+
+# --- Piece Values for AI (material) ---
+piece_values = {'P': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 1000}
+
+# --- Initial Board Setup ---
+initial_board = [
+    ['bR','bN','bB','bQ','bK','bB','bN','bR'],
+    ['bP']*8,
+    ['  ']*8,
+    ['  ']*8,
+    ['  ']*8,
+    ['  ']*8,
+    ['wP']*8,
+    ['wR','wN','wB','wQ','wK','wB','wN','wR']
+]
+
+# Castling rights: True if rook/king hasn't moved (K = kingside, Q = queenside)
+ALL_CASTLING = {'wK': True, 'wQ': True, 'bK': True, 'bQ': True}
+NO_CASTLING = {'wK': False, 'wQ': False, 'bK': False, 'bQ': False}
+
+# -------------------------
+# Helpers
+# -------------------------
+def in_bounds(i,j):
+    return 0 <= i < 8 and 0 <= j < 8
+
+def square_name(square):
+    """(i,j) -> algebraic name, e.g. (6,4) -> 'e2'."""
+    i, j = square
+    return 'abcdefgh'[j] + str(8 - i)
+
+def parse_square(name):
+    """Algebraic name -> (i,j), e.g. 'e2' -> (6,4)."""
+    return (8 - int(name[1]), 'abcdefgh'.index(name[0]))
+
+def move_name(move):
+    """((si,sj),(ei,ej)) -> coordinate notation, e.g. 'e2e4'."""
+    return square_name(move[0]) + square_name(move[1])
+
+def board_from_fen(fen):
+    """
+    Parse a FEN string into (board, side_to_move, rights, en_passant_square).
+    en_passant_square is (i,j) or None; the engine itself does not play en passant.
+    """
+    fields = fen.split()
+    temp_board = []
+    for rank in fields[0].split('/'):
+        row = []
+        for ch in rank:
+            if ch.isdigit():
+                row.extend(['  '] * int(ch))
+            else:
+                row.append(('w' if ch.isupper() else 'b') + ch.upper())
+        temp_board.append(row)
+    side = fields[1] if len(fields) > 1 else 'w'
+    castling = fields[2] if len(fields) > 2 else '-'
+    rights = {'wK': 'K' in castling, 'wQ': 'Q' in castling, 'bK': 'k' in castling, 'bQ': 'q' in castling}
+    ep = fields[3] if len(fields) > 3 else '-'
+    return temp_board, side, rights, (parse_square(ep) if ep != '-' else None)
+
+# Zobrist keys: one random 64-bit number per piece/square, side to move and castling right.
+# Fixed seed so a position always hashes to the same key (also across runs).
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST_PIECES = {p: [_zobrist_rng.getrandbits(64) for _ in range(64)] for p in PIECE_NAMES}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_rng.getrandbits(64)
+ZOBRIST_CASTLING = {r: _zobrist_rng.getrandbits(64) for r in ('wK', 'wQ', 'bK', 'bQ')}
+
+# castling rights lost when a piece moves from or to these squares (king and rook home squares)
+RIGHTS_TOUCHED = {
+    (7,4): ('wK','wQ'), (7,7): ('wK',), (7,0): ('wQ',),
+    (0,4): ('bK','bQ'), (0,7): ('bK',), (0,0): ('bQ',),
+}
+
+def board_key(temp_board, side_to_move, rights=None):
+    """Full Zobrist hash of a position (search updates it incrementally in make_move)."""
+    if rights is None:
+        rights = NO_CASTLING
+    key = ZOBRIST_BLACK_TO_MOVE if side_to_move == 'b' else 0
+    for i, row in enumerate(temp_board):
+        for j, p in enumerate(row):
+            if p != '  ':
+                key ^= ZOBRIST_PIECES[p][i*8 + j]
+    for r, allowed in rights.items():
+        if allowed:
+            key ^= ZOBRIST_CASTLING[r]
+    return key
+
+def find_king(player, temp_board):
+    if isinstance(temp_board, BitboardPosition):
+        return bb_find_king(player, temp_board)
+    key = player + 'K'
+    for i in range(8):
+        for j in range(8):
+            if temp_board[i][j] == key:
+                return (i,j)
+    return None
+
+def make_move(start, end, temp_board, rights=None, key=None, material=None):
+    """Apply move in place on temp_board and return an undo record.
+       Pawn auto-promotes to Q, king moving two squares also moves the rook.
+       If rights (castling rights dict) is given it is updated in place; if key (Zobrist
+       hash) is given the new hash is computed incrementally and stored as undo[-1].
+       Likewise material (material + center score, see material_score) ends up in undo[-2].
+       Pass the record to unmake_move to restore the board (and rights) exactly.
+    """
+    si,sj = start
+    ei,ej = end
+    piece = temp_board[si][sj]
+    captured = temp_board[ei][ej]
+    # move piece
+    temp_board[ei][ej] = piece
+    temp_board[si][sj] = '  '
+
+    # castle handling: if king moved two squares horizontally, move rook
+    rook_move = None
+    if piece != '  ' and piece[1] == 'K' and abs(sj - ej) == 2:
+        if ej > sj:
+            # kingside: rook from h-file -> f-file
+            cs, ce = 7, ej - 1
+        else:
+            # queenside: rook from a-file -> d-file
+            cs, ce = 0, ej + 1
+        rook_piece = temp_board[si][cs]
+        # move rook if present
+        if rook_piece != '  ' and rook_piece[1] == 'R':
+            temp_board[si][ce] = rook_piece
+            temp_board[si][cs] = '  '
+            rook_move = (si, cs, ce)
+
+    # pawn promotion (unmake puts the original pawn back on the start square)
+    if piece != '  ' and piece[1] == 'P':
+        if (piece[0] == 'w' and ei == 0) or (piece[0] == 'b' and ei == 7):
+            temp_board[ei][ej] = piece[0] + 'Q'
+
+    # castling rights lost by this move (restored by unmake_move)
+    revoked = ()
+    if rights is not None and (start in RIGHTS_TOUCHED or end in RIGHTS_TOUCHED):
+        touched = RIGHTS_TOUCHED.get(start, ()) + RIGHTS_TOUCHED.get(end, ())
+        revoked = tuple(r for r in dict.fromkeys(touched) if rights[r])
+        for r in revoked:
+            rights[r] = False
+
+    # incremental Zobrist update: only the squares and rights that changed
+    if key is not None and piece != '  ':
+        key ^= ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PIECES[piece][si*8 + sj] ^ ZOBRIST_PIECES[temp_board[ei][ej]][ei*8 + ej]
+        if captured != '  ':
+            key ^= ZOBRIST_PIECES[captured][ei*8 + ej]
+        if rook_move is not None:
+            r, cs, ce = rook_move
+            rook_keys = ZOBRIST_PIECES[temp_board[r][ce]]
+            key ^= rook_keys[r*8 + cs] ^ rook_keys[r*8 + ce]
+        for r in revoked:
+            key ^= ZOBRIST_CASTLING[r]
+
+    # incremental material/center score (the undo record keeps the new value only)
+    if material is not None and piece != '  ':
+        ps = PIECE_SQUARE
+        material += ps[temp_board[ei][ej]][ei*8 + ej] - ps[piece][si*8 + sj]
+        if captured != '  ':
+            material -= ps[captured][ei*8 + ej]
+        if rook_move is not None:
+            r, cs, ce = rook_move
+            rook_ps = ps[temp_board[r][ce]]
+            material += rook_ps[r*8 + ce] - rook_ps[r*8 + cs]
+
+    return (start, end, piece, captured, rook_move, rights, revoked, material, key)
+
+def unmake_move(temp_board, undo):
+    """Take back a move made by make_move using its undo record."""
+    (si,sj), (ei,ej), piece, captured, rook_move, rights, revoked, _, _ = undo
+    temp_board[si][sj] = piece
+    temp_board[ei][ej] = captured
+    if rook_move is not None:
+        r, cs, ce = rook_move
+        temp_board[r][cs] = temp_board[r][ce]
+        temp_board[r][ce] = '  '
+    for r in revoked:
+        rights[r] = True
+
+def make_move_on_board(start, end, temp_board, update_castling=True, rights=None, key=None):
+    """Apply move on given board. Pawn auto-promotes to Q.
+       Handles castling rook movement if king moves two squares.
+       Returns the new Zobrist key when key is given (else None).
+    """
+    # Castling rights are only updated when a rights dict is passed (update_castling=False skips it).
+    undo = make_move(start, end, temp_board, rights if update_castling else None, key)
+    return undo[-1]
+
+class Position:
+    """
+    A position being searched: board (changed in place), side to move, castling_rights
+    (changed in place) and Zobrist hash, plus the incremental material score and both king
+    squares, so none of them is rescanned per node. make()/unmake() play and take back a
+    move code (see fill_moves) and keep all of it in step. With EVAL_MOBILITY, mobility
+    holds every square's piece_mobility and mobility_total their sum; make() recomputes
+    only the pieces whose moves the changed squares can affect, so evaluate() is a lookup.
+    """
+    __slots__ = ('board', 'side', 'castling_rights', 'hash', 'material', 'kings', 'mobility',
+                 'mobility_total', '_saved')
+
+    def __init__(self, board, side, castling_rights=None, key=None, material=None):
+        self.board = board
+        self.side = side
+        self.castling_rights = castling_rights if castling_rights is not None else dict(NO_CASTLING)
+        self.hash = key if key is not None else board_key(board, side, self.castling_rights)
+        self.material = material if material is not None else material_score(board)
+        self.kings = {'w': find_king('w', board), 'b': find_king('b', board)}
+        self.mobility = mobility_table(board) if EVAL_MOBILITY else None
+        self.mobility_total = sum(self.mobility) if EVAL_MOBILITY else 0
+        # hash and material of each position make() left (and its mobility changes), for unmake()
+        self._saved = []
+
+    def evaluate(self):
+        """evaluate_board() of the position, from the incremental terms."""
+        if self.mobility is None:
+            return self.material
+        return self.material + 0.02 * self.mobility_total
+
+    def make(self, code):
+        """Play a move code; returns the undo record to pass to unmake()."""
+        start, end = MOVE_PAIRS[code & MOVE_SQUARES]
+        undo = make_move(start, end, self.board, self.castling_rights, self.hash, self.material)
+        self._saved.append(self.hash)
+        self._saved.append(self.material)
+        self.hash = undo[-1]
+        self.material = undo[-2]
+        if undo[2][1] == 'K':
+            self.kings[self.side] = end
+        self.side = 'b' if self.side == 'w' else 'w'
+        if self.mobility is not None:
+            self._saved.append(self._update_mobility(undo))
+        return undo
+
+    def _update_mobility(self, undo):
+        """Recompute piece_mobility for the changed squares and every piece whose moves run
+           over one of them; returns (old total, [(square, old value), ...]) for unmake()."""
+        (si, sj), (ei, ej), _, _, rook_move = undo[:5]
+        if rook_move is None:
+            changed = (si*8 + sj, ei*8 + ej)
+        else:
+            r, cs, ce = rook_move
+            changed = (si*8 + sj, ei*8 + ej, r*8 + cs, r*8 + ce)
+        b = self.board
+        flat = b[0] + b[1] + b[2] + b[3] + b[4] + b[5] + b[6] + b[7]
+        affected = set(changed)
+        for c in changed:
+            # the nearest slider on each line through c (the changed squares count as empty:
+            # they are recomputed anyway, and a piece behind one may see c before or after)
+            for ray in SLIDER_RAYS['R'][c]:
+                for t in ray:
+                    q = flat[t]
+                    if q != '  ' and t not in changed:
+                        if q[1] == 'R' or q[1] == 'Q':
+                            affected.add(t)
+                        break
+            for ray in SLIDER_RAYS['B'][c]:
+                for t in ray:
+                    q = flat[t]
+                    if q != '  ' and t not in changed:
+                        if q[1] == 'B' or q[1] == 'Q':
+                            affected.add(t)
+                        break
+            for t in KNIGHT_TARGETS[c]:
+                if flat[t][1] == 'N':
+                    affected.add(t)
+            # kings, and pawns pushing onto or capturing on c
+            for t in KING_TARGETS[c]:
+                q = flat[t][1]
+                if q == 'P' or q == 'K':
+                    affected.add(t)
+            for t in PAWN_DOUBLE_SOURCES[c]:
+                if flat[t][1] == 'P':
+                    affected.add(t)
+        mobility = self.mobility
+        total = self.mobility_total
+        old = []
+        for sq in affected:
+            p = flat[sq]
+            value = piece_mobility(flat, sq, p) if p != '  ' else 0
+            if value != mobility[sq]:
+                old.append((sq, mobility[sq]))
+                mobility[sq] = value
+        for sq, value in old:
+            total += mobility[sq] - value
+        saved = (self.mobility_total, old)
+        self.mobility_total = total
+        return saved
+
+    def unmake(self, undo):
+        unmake_move(self.board, undo)
+        self.side = 'b' if self.side == 'w' else 'w'
+        if undo[2][1] == 'K':
+            self.kings[self.side] = undo[0]
+        if self.mobility is not None:
+            self.mobility_total, old = self._saved.pop()
+            mobility = self.mobility
+            for sq, value in old:
+                mobility[sq] = value
+        self.material = self._saved.pop()
+        self.hash = self._saved.pop()
+
+    def make_null(self):
+        """Pass the turn (null-move pruning); take it back with unmake_null()."""
+        self.side = 'b' if self.side == 'w' else 'w'
+        self.hash ^= ZOBRIST_BLACK_TO_MOVE
+
+    def unmake_null(self):
+        self.side = 'b' if self.side == 'w' else 'w'
+        self.hash ^= ZOBRIST_BLACK_TO_MOVE
+
+    def has_pieces(self, side):
+        """True if side has anything besides king and pawns (null move is unsafe without)."""
+        for row in self.board:
+            for p in row:
+                if p[0] == side and p[1] != 'P' and p[1] != 'K':
+                    return True
+        return False
+
+# Non-recursive attack detection to prevent recursion with generate_moves
+def is_square_attacked(square, by_player, temp_board):
+    """
+    Return True if the square (i,j) is attacked by any piece of by_player.
+    Handles pawn, knight, sliding pieces and king adjacency.
+    """
+    i,j = square
+    attacker = by_player
+    if isinstance(temp_board, BitboardPosition):
+        return bb_is_square_attacked(i*8 + j, attacker, temp_board)
+
+    # pawn attacks
+    if attacker == 'w':
+        # white pawn at (i+1, j±1) attacks (i,j)
+        for dj in (-1, 1):
+            pi, pj = i+1, j+dj
+            if in_bounds(pi,pj) and temp_board[pi][pj] == 'wP':
+                return True
+    else:
+        # black pawn at (i-1, j±1)
+        for dj in (-1, 1):
+            pi, pj = i-1, j+dj
+            if in_bounds(pi,pj) and temp_board[pi][pj] == 'bP':
+                return True
+
+    # knights
+    knight_moves = [(-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)]
+    for di,dj in knight_moves:
+        ni,nj = i+di, j+dj
+        if in_bounds(ni,nj) and temp_board[ni][nj] != '  ' and temp_board[ni][nj][0] == attacker and temp_board[ni][nj][1] == 'N':
+            return True
+
+    # sliding pieces (orthogonal and diagonal)
+    directions = [
+        (-1,0,('R','Q')), (1,0,('R','Q')), (0,-1,('R','Q')), (0,1,('R','Q')),
+        (-1,-1,('B','Q')), (1,1,('B','Q')), (1,-1,('B','Q')), (-1,1,('B','Q'))
+    ]
+    for di,dj,types in directions:
+        ni, nj = i+di, j+dj
+        while in_bounds(ni,nj):
+            p = temp_board[ni][nj]
+            if p == '  ':
+                ni += di; nj += dj
+                continue
+            if p[0] == attacker and p[1] in types:
+                return True
+            # blocked by any piece
+            break
+
+    # king adjacency
+    for di in (-1,0,1):
+        for dj in (-1,0,1):
+            if di==0 and dj==0: continue
+            ni,nj = i+di, j+dj
+            if in_bounds(ni,nj) and temp_board[ni][nj] != '  ' and temp_board[ni][nj][0] == attacker and temp_board[ni][nj][1] == 'K':
+                return True
+
+    return False
+
+def is_check(player, temp_board, king=None):
+    """True if player's king is attacked on temp_board (king: its square if already known)."""
+    king_pos = king if king is not None else find_king(player, temp_board)
+    if king_pos is None:
+        # missing king -> treat as 'in check' for search
+        return True
+    enemy = 'b' if player == 'w' else 'w'
+    return is_square_attacked(king_pos, enemy, temp_board)
+
+# Move codes: from_square << 6 | to_square (pack_move) in the low 12 bits, flags above.
+# Search move lists are array('H') buffers of these, filled in place by fill_moves.
+MOVE_CAPTURE = 1 << 12
+MOVE_PROMOTION = 1 << 13
+MOVE_CASTLE = 1 << 14
+MOVE_SQUARES = 0xFFF
+MAX_MOVES = 256         # more than the most legal moves any position has (218)
+MAX_PIECE_MOVES = 32    # a queen has at most 27 moves, a king 8 plus two castles
+SQUARES = [(sq >> 3, sq & 7) for sq in range(64)]
+# code & MOVE_SQUARES -> ((si,sj),(ei,ej)), shared so decoding a move allocates nothing
+MOVE_PAIRS = [(SQUARES[c >> 6], SQUARES[c & 63]) for c in range(4096)]
+
+def move_buffer(size=MAX_MOVES):
+    return array('H', bytes(2 * size))
+
+def check_info(temp_board, player, king=None):
+    """
+    Checkers and pins against player's king, found once per position by walking out
+    from the king instead of testing every move afterwards.
+    Returns (king, checks, pins), or None if player has no king on the board:
+      checks: None when not in check, else the set of squares (i*8+j) a non-king move must
+              end on (capture the checker or block its ray); empty in double check.
+      pins:   {square of a pinned piece: the squares on its pin ray, pinner included}.
+    """
+    if king is None:
+        king = find_king(player, temp_board)
+        if king is None:
+            return None
+    enemy = 'b' if player == 'w' else 'w'
+    sq = king[0]*8 + king[1]
+    checkers = []
+    pins = {}
+    # a pawn of player standing on the king's square would capture the squares enemy pawns check from
+    for c in PAWN_CAPTURE_TARGETS[player][sq]:
+        if temp_board[c >> 3][c & 7] == enemy + 'P':
+            checkers.append({c})
+    for c in KNIGHT_TARGETS[sq]:
+        if temp_board[c >> 3][c & 7] == enemy + 'N':
+            checkers.append({c})
+    for slider in ('R', 'B'):
+        for ray in SLIDER_RAYS[slider][sq]:
+            path = []
+            own = None
+            for c in ray:
+                q = temp_board[c >> 3][c & 7]
+                path.append(c)
+                if q == '  ':
+                    continue
+                if q[0] == player:
+                    if own is not None:
+                        break
+                    own = c
+                    continue
+                if q[1] == slider or q[1] == 'Q':
+                    if own is None:
+                        checkers.append(set(path))
+                    else:
+                        pins[own] = set(path)
+                break
+    if not checkers:
+        checks = None
+    elif len(checkers) == 1:
+        checks = checkers[0]
+    else:
+        checks = set()
+    return king, checks, pins
+
+def piece_moves(temp_board, sq, piece, buf, n, rights=None, legality=None, captures_only=False):
+    """
+    Write the moves of piece on square sq (i*8+j) into buf from index n as move codes and
+    return the new count. legality: check_info() for the piece's side to keep only legal
+    moves, None for pseudo-legal ones. captures_only: captures and promotion pushes only
+    (no castling), for the quiescence search. Castling needs rights (None = no castling).
+    """
+    color, p_type = piece
+    enemy = 'b' if color == 'w' else 'w'
+    base = sq << 6
+    first = n
+
+    # Pawn
+    if p_type == 'P':
+        if color == 'w':
+            step, start_row, last_row = -8, 6, 0
+        else:
+            step, start_row, last_row = 8, 1, 7
+        t = sq + step
+        if 0 <= t < 64:
+            promotion = MOVE_PROMOTION if t >> 3 == last_row else 0
+            # forward one, and two from the start row
+            if temp_board[t >> 3][t & 7] == '  ':
+                if promotion or not captures_only:
+                    buf[n] = base | t | promotion; n += 1
+                t2 = t + step
+                if not captures_only and sq >> 3 == start_row and temp_board[t2 >> 3][t2 & 7] == '  ':
+                    buf[n] = base | t2; n += 1
+            for c in PAWN_CAPTURE_TARGETS[color][sq]:
+                if temp_board[c >> 3][c & 7][0] == enemy:
+                    buf[n] = base | c | MOVE_CAPTURE | promotion; n += 1
+        # en-passant not implemented
+
+    # Knight / King steps
+    elif p_type == 'N' or p_type == 'K':
+        for c in (KNIGHT_TARGETS if p_type == 'N' else KING_TARGETS)[sq]:
+            q = temp_board[c >> 3][c & 7]
+            if q == '  ':
+                if not captures_only:
+                    buf[n] = base | c; n += 1
+            elif q[0] == enemy:
+                buf[n] = base | c | MOVE_CAPTURE; n += 1
+
+        # Castling (king-side & queen-side) - only if rights exist and squares are clear and not in check
+        own_rank = 7 if color == 'w' else 0
+        if p_type == 'K' and not captures_only and sq == own_rank*8 + 4 and rights is not None:
+            rights_k = rights.get(color + 'K', False)
+            rights_q = rights.get(color + 'Q', False)
+            if rights_k or rights_q:
+                in_check = legality[1] is not None if legality is not None else is_check(color, temp_board)
+                back = temp_board[own_rank]
+                if not in_check:
+                    # kingside: squares between king and rook empty and not attacked, rook on the h-file
+                    if (rights_k and back[5] == '  ' and back[6] == '  ' and back[7] == color + 'R'
+                            and not is_square_attacked((own_rank,5), enemy, temp_board)
+                            and not is_square_attacked((own_rank,6), enemy, temp_board)):
+                        buf[n] = base | (sq + 2) | MOVE_CASTLE; n += 1
+                    # queenside
+                    if (rights_q and back[3] == '  ' and back[2] == '  ' and back[1] == '  ' and back[0] == color + 'R'
+                            and not is_square_attacked((own_rank,3), enemy, temp_board)
+                            and not is_square_attacked((own_rank,2), enemy, temp_board)):
+                        buf[n] = base | (sq - 2) | MOVE_CASTLE; n += 1
+
+    # Bishop / Rook / Queen (sliders)
+    else:
+        for ray in SLIDER_RAYS[p_type][sq]:
+            for c in ray:
+                q = temp_board[c >> 3][c & 7]
+                if q == '  ':
+                    if not captures_only:
+                        buf[n] = base | c; n += 1
+                    continue
+                if q[0] == enemy:
+                    buf[n] = base | c | MOVE_CAPTURE; n += 1
+                # own piece blocks
+                break
+
+    if legality is None or n == first:
+        return n
+    # Drop moves that leave own king in check: set lookups for other pieces, and for the
+    # king an attack test with the king lifted off the board so it cannot hide behind itself
+    # (castling squares were already tested above)
+    _, checks, pins = legality
+    kept = first
+    if p_type == 'K':
+        row = temp_board[sq >> 3]
+        row[sq & 7] = '  '
+        try:
+            for x in range(first, n):
+                code = buf[x]
+                if code & MOVE_CASTLE or not is_square_attacked(SQUARES[code & 63], enemy, temp_board):
+                    buf[kept] = code; kept += 1
+        finally:
+            row[sq & 7] = piece
+        return kept
+    pin = pins.get(sq)
+    if checks is None and pin is None:
+        return n
+    for x in range(first, n):
+        code = buf[x]
+        t = code & 63
+        if (checks is None or t in checks) and (pin is None or t in pin):
+            buf[kept] = code; kept += 1
+    return kept
+
+def filter_by_making(temp_board, player, buf, first, n):
+    """Keep the codes in buf[first:n] that do not leave player in check by making each move
+       (for boards check_info cannot handle, e.g. no king); returns the new count."""
+    kept = first
+    for x in range(first, n):
+        code = buf[x]
+        start, end = MOVE_PAIRS[code & MOVE_SQUARES]
+        undo = make_move(start, end, temp_board)
+        in_check = is_check(player, temp_board)
+        unmake_move(temp_board, undo)
+        if not in_check:
+            buf[kept] = code; kept += 1
+    return kept
+
+def fill_moves(temp_board, player, buf, rights=None, king=None, captures_only=False):
+    """
+    Write player's legal moves into buf (an array('H') of at least MAX_MOVES, see move_buffer)
+    as move codes and return how many. king: player's king square if already known.
+    captures_only: captures and promotions only (see piece_moves).
+    """
+    legality = check_info(temp_board, player, king)
+    if legality is not None and legality[1] is not None and not legality[1]:
+        # double check: only the king can move
+        king = legality[0]
+        return piece_moves(temp_board, king[0]*8 + king[1], player + 'K', buf, 0, rights, legality, captures_only)
+    n = 0
+    sq = 0
+    for row in temp_board:
+        for p in row:
+            if p[0] == player:
+                n = piece_moves(temp_board, sq, p, buf, n, rights, legality, captures_only)
+            sq += 1
+    if legality is None:
+        n = filter_by_making(temp_board, player, buf, 0, n)
+    return n
+
+def generate_moves(piece, pos, temp_board, ignore_check=False, rights=None, legality=None):
+    """
+    Generate pseudo-legal moves for piece at pos on temp_board.
+    If ignore_check==False filter out moves that leave own king in check.
+    Includes castling logic for the king based on rights (None = no castling).
+    legality: check_info() for the mover, when the caller already has it for this position.
+    """
+    if isinstance(temp_board, BitboardPosition):
+        return bb_generate_moves(piece, pos, temp_board, ignore_check)
+    if legality is None and not ignore_check:
+        legality = check_info(temp_board, piece[0])
+    buf = move_buffer(MAX_PIECE_MOVES)
+    sq = pos[0]*8 + pos[1]
+    n = piece_moves(temp_board, sq, piece, buf, 0, rights, legality)
+    if legality is None and not ignore_check:
+        # no king on the board: make/unmake every candidate (is_check treats that as check)
+        n = filter_by_making(temp_board, piece[0], buf, 0, n)
+    return [SQUARES[buf[x] & 63] for x in range(n)]
+
+def get_all_moves_for_player(temp_board, player, rights=None, king=None):
+    """Legal moves for player as (start, end) pairs; king: player's king square if already known."""
+    if isinstance(temp_board, BitboardPosition):
+        return bb_get_all_moves_for_player(temp_board, player)
+    buf = move_buffer()
+    n = fill_moves(temp_board, player, buf, rights, king)
+    return [MOVE_PAIRS[buf[x] & MOVE_SQUARES] for x in range(n)]
+
+def is_checkmate(player, temp_board, rights=None):
+    """True if player has no legal moves and is in check (temp_board may be a BitboardPosition)."""
+    moves = get_all_moves_for_player(temp_board, player, rights)
+    if moves:
+        return False
+    return is_check(player, temp_board)
+
+# -------------------------
+# Evaluation
+# -------------------------
+# Material + center control per piece and square, signed (+ for White).
+# Kept incrementally by make_move during search, so leaves do not rescan it.
+CENTER_SQUARES = {(3,3), (3,4), (4,3), (4,4)}
+PIECE_SQUARE = {
+    p: [(1 if p[0] == 'w' else -1) * (piece_values[p[1]] + (0.2 if divmod(sq, 8) in CENTER_SQUARES else 0))
+        for sq in range(64)]
+    for p in PIECE_NAMES
+}
+
+# Precomputed target squares (as square indices i*8 + j) for the mobility term.
+def _target_lists(deltas):
+    return [[(i+di)*8 + j+dj for di, dj in deltas if in_bounds(i+di, j+dj)]
+            for i in range(8) for j in range(8)]
+
+def _ray_lists(directions):
+    rays = []
+    for i in range(8):
+        for j in range(8):
+            sq_rays = []
+            for di, dj in directions:
+                ray = []
+                ni, nj = i+di, j+dj
+                while in_bounds(ni, nj):
+                    ray.append(ni*8 + nj)
+                    ni += di; nj += dj
+                if ray:
+                    sq_rays.append(ray)
+            rays.append(sq_rays)
+    return rays
+
+KNIGHT_TARGETS = _target_lists([(-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)])
+KING_TARGETS = _target_lists([(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)])
+PAWN_CAPTURE_TARGETS = {'w': _target_lists([(-1,-1),(-1,1)]), 'b': _target_lists([(1,-1),(1,1)])}
+SLIDER_RAYS = {
+    'B': _ray_lists([(-1,-1),(-1,1),(1,-1),(1,1)]),
+    'R': _ray_lists([(-1,0),(1,0),(0,-1),(0,1)]),
+    'Q': _ray_lists([(-1,0),(1,0),(0,-1),(0,1),(-1,-1),(-1,1),(1,-1),(1,1)]),
+}
+
+# positional_score leaves out castling targets from king mobility, so an evaluation
+# differs from the full term-by-term one (bb_evaluate) by at most 2 * 0.02.
+EVAL_TOLERANCE = 0.04
+
+def material_score(temp_board):
+    """Material + center control from scratch (search updates it incrementally)."""
+    score = 0.0
+    for i, row in enumerate(temp_board):
+        for j, p in enumerate(row):
+            if p != '  ':
+                score += PIECE_SQUARE[p][i*8 + j]
+    return score
+
+# squares whose pawn double-pushes over or onto a square (white from rank 2, black from rank 7)
+PAWN_DOUBLE_SOURCES = [[t for t in (sq + 16, sq - 16) if 8 <= t < 16 or 48 <= t < 56] for sq in range(64)]
+KING_SAFETY_UNITS = 15   # the 0.3 king-safety step in 0.02 mobility units
+
+def piece_mobility(flat, sq, p):
+    """
+    Mobility (pseudo-legal moves) of piece p on square sq of a flattened board, plus the
+    king-safety penalty if p is a king, in units of 0.02: positive for White.
+    """
+    color, p_type = p
+    n = 0
+    if p_type == 'P':
+        if color == 'w':
+            if sq >= 8 and flat[sq-8] == '  ':
+                n = 2 if sq >= 48 and flat[sq-16] == '  ' else 1
+            for c in PAWN_CAPTURE_TARGETS['w'][sq]:
+                if flat[c][0] == 'b':
+                    n += 1
+        else:
+            if sq < 56 and flat[sq+8] == '  ':
+                n = 2 if sq < 16 and flat[sq+16] == '  ' else 1
+            for c in PAWN_CAPTURE_TARGETS['b'][sq]:
+                if flat[c][0] == 'w':
+                    n += 1
+    elif p_type == 'N':
+        for c in KNIGHT_TARGETS[sq]:
+            if flat[c][0] != color:
+                n += 1
+    elif p_type == 'K':
+        allies = 0
+        for c in KING_TARGETS[sq]:
+            if flat[c][0] == color:
+                allies += 1
+        # king safety: (8 - allies_near) * 0.3, where allies_near counts the king itself
+        n = len(KING_TARGETS[sq]) - allies - (7 - allies) * KING_SAFETY_UNITS
+    else:
+        for ray in SLIDER_RAYS[p_type][sq]:
+            for c in ray:
+                q = flat[c]
+                if q == '  ':
+                    n += 1
+                    continue
+                if q[0] != color:
+                    n += 1
+                break
+    return n if color == 'w' else -n
+
+def mobility_table(temp_board):
+    """piece_mobility of every square (0 where empty), as Position keeps it."""
+    flat = (temp_board[0] + temp_board[1] + temp_board[2] + temp_board[3] +
+            temp_board[4] + temp_board[5] + temp_board[6] + temp_board[7])
+    return [piece_mobility(flat, sq, p) if p != '  ' else 0 for sq, p in enumerate(flat)]
+
+def positional_score(temp_board):
+    """Mobility (0.02 per pseudo-legal move) and king safety, from the precomputed target maps.
+       The search keeps this term up to date per move instead (see Position)."""
+    return 0.02 * sum(mobility_table(temp_board))
+
+def evaluate_board(temp_board, material=None):
+    """Smarter evaluation: material + mobility + center control + king safety.
+       material: incrementally maintained material/center score, if the caller has it.
+       Mobility and king safety are skipped when EVAL_MOBILITY is False.
+       The search uses Position.evaluate(), which keeps every term incrementally.
+    """
+    if isinstance(temp_board, BitboardPosition):
+        return bb_evaluate(temp_board)
+    if material is None:
+        material = material_score(temp_board)
+    if not EVAL_MOBILITY:
+        return material
+    return material + positional_score(temp_board)
+
+# -------------------------
+# Bitboard backend
+# -------------------------
+# Alternative position representation: one 64-bit int per piece type and colour.
+# Bit (i*8 + j) is board square (i, j), so bit 0 is a8 and bit 63 is h1.
+BB_PIECES = PIECE_NAMES
+BB_INDEX = {p: n for n, p in enumerate(BB_PIECES)}
+CENTER_BB = (1 << 27) | (1 << 28) | (1 << 35) | (1 << 36)
+
+def _step_table(deltas):
+    # attack mask per square for pieces that jump a fixed offset (knight, king, pawn captures)
+    table = []
+    for sq in range(64):
+        i, j = divmod(sq, 8)
+        mask = 0
+        for di, dj in deltas:
+            if in_bounds(i+di, j+dj):
+                mask |= 1 << ((i+di)*8 + j+dj)
+        table.append(mask)
+    return table
+
+def _ray_table(di, dj):
+    # all squares from sq (exclusive) to the board edge in one direction
+    table = []
+    for sq in range(64):
+        i, j = divmod(sq, 8)
+        mask = 0
+        ni, nj = i+di, j+dj
+        while in_bounds(ni, nj):
+            mask |= 1 << (ni*8 + nj)
+            ni += di; nj += dj
+        table.append(mask)
+    return table
+
+KNIGHT_ATTACKS = _step_table([(-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)])
+KING_ATTACKS = _step_table([(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)])
+# squares a pawn of that colour on sq attacks
+PAWN_ATTACKS = {'w': _step_table([(-1,-1),(-1,1)]), 'b': _step_table([(1,-1),(1,1)])}
+
+# (ray table, True if square index increases along the ray)
+ROOK_RAYS = [(_ray_table(-1,0), False), (_ray_table(1,0), True),
+             (_ray_table(0,-1), False), (_ray_table(0,1), True)]
+BISHOP_RAYS = [(_ray_table(-1,-1), False), (_ray_table(-1,1), False),
+               (_ray_table(1,-1), True), (_ray_table(1,1), True)]
+
+def slider_attacks(sq, occ, rays):
+    """Attack mask of a sliding piece on sq: each ray is cut after its first blocker."""
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occ
+        if blockers:
+            # nearest blocker is the lowest bit on increasing rays, highest on decreasing ones
+            if positive:
+                b = (blockers & -blockers).bit_length() - 1
+            else:
+                b = blockers.bit_length() - 1
+            ray ^= table[b]
+        attacks |= ray
+    return attacks
+
+def iter_bits(bb):
+    """Yield the square index of every set bit."""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+class BitboardPosition:
+    """Position as 12 bitboards, indexed like BB_PIECES (white P..K then black P..K).
+       rights: castling rights dict used for king moves (None = no castling)."""
+
+    def __init__(self, temp_board=None, rights=None):
+        self.bbs = [0] * 12
+        self.rights = rights if rights is not None else NO_CASTLING
+        if temp_board is not None:
+            self.load(temp_board)
+
+    def load(self, temp_board):
+        """Fill the bitboards from a list-of-strings board."""
+        bbs = [0] * 12
+        for i, row in enumerate(temp_board):
+            for j, p in enumerate(row):
+                if p != '  ':
+                    bbs[BB_INDEX[p]] |= 1 << (i*8 + j)
+        self.bbs = bbs
+
+    def to_board(self):
+        """Convert back to a list-of-strings board."""
+        out = [['  ']*8 for _ in range(8)]
+        for n, bb in enumerate(self.bbs):
+            for sq in iter_bits(bb):
+                out[sq >> 3][sq & 7] = BB_PIECES[n]
+        return out
+
+    def occupancy(self, color):
+        o = 0 if color == 'w' else 6
+        b = self.bbs
+        return b[o] | b[o+1] | b[o+2] | b[o+3] | b[o+4] | b[o+5]
+
+    def piece_at(self, sq):
+        bit = 1 << sq
+        for n, bb in enumerate(self.bbs):
+            if bb & bit:
+                return BB_PIECES[n]
+        return '  '
+
+def bb_find_king(player, pos):
+    k = pos.bbs[BB_INDEX[player + 'K']]
+    if not k:
+        return None
+    sq = (k & -k).bit_length() - 1
+    return (sq >> 3, sq & 7)
+
+def bb_is_square_attacked(sq, by_player, pos):
+    """Bitboard version of is_square_attacked; sq is a square index 0..63."""
+    b = pos.bbs
+    o = 0 if by_player == 'w' else 6
+    # a pawn of the defending colour on sq attacks exactly the squares attacking pawns stand on
+    if PAWN_ATTACKS['b' if by_player == 'w' else 'w'][sq] & b[o]:
+        return True
+    if KNIGHT_ATTACKS[sq] & b[o+1] or KING_ATTACKS[sq] & b[o+5]:
+        return True
+    occ = pos.occupancy('w') | pos.occupancy('b')
+    rq = b[o+3] | b[o+4]
+    if rq and slider_attacks(sq, occ, ROOK_RAYS) & rq:
+        return True
+    bq = b[o+2] | b[o+4]
+    if bq and slider_attacks(sq, occ, BISHOP_RAYS) & bq:
+        return True
+    return False
+
+def bb_pseudo_targets(piece, sq, pos, own, enemy_occ):
+    """Mask of pseudo-legal destination squares (incl. castling) for piece on sq."""
+    color = piece[0]
+    p_type = piece[1]
+    occ = own | enemy_occ
+    if p_type == 'P':
+        targets = PAWN_ATTACKS[color][sq] & enemy_occ
+        step = -8 if color == 'w' else 8
+        one = sq + step
+        if not (occ >> one) & 1:
+            targets |= 1 << one
+            start_row = 6 if color == 'w' else 1
+            if sq >> 3 == start_row and not (occ >> (one + step)) & 1:
+                targets |= 1 << (one + step)
+        return targets
+    if p_type == 'N':
+        return KNIGHT_ATTACKS[sq] & ~own
+    if p_type == 'B':
+        return slider_attacks(sq, occ, BISHOP_RAYS) & ~own
+    if p_type == 'R':
+        return slider_attacks(sq, occ, ROOK_RAYS) & ~own
+    if p_type == 'Q':
+        return (slider_attacks(sq, occ, ROOK_RAYS) | slider_attacks(sq, occ, BISHOP_RAYS)) & ~own
+
+    # King
+    targets = KING_ATTACKS[sq] & ~own
+    enemy = 'b' if color == 'w' else 'w'
+    base = 56 if color == 'w' else 0
+    if sq == base + 4 and not bb_is_square_attacked(sq, enemy, pos):
+        rook = pos.bbs[BB_INDEX[color + 'R']]
+        if (pos.rights.get(color + 'K', False) and not occ & (0b11 << (base + 5))
+                and (rook >> (base + 7)) & 1
+                and not bb_is_square_attacked(base + 5, enemy, pos)
+                and not bb_is_square_attacked(base + 6, enemy, pos)):
+            targets |= 1 << (base + 6)
+        if (pos.rights.get(color + 'Q', False) and not occ & (0b111 << (base + 1))
+                and rook & (1 << base)
+                and not bb_is_square_attacked(base + 3, enemy, pos)
+                and not bb_is_square_attacked(base + 2, enemy, pos)):
+            targets |= 1 << (base + 2)
+    return targets
+
+def bb_make_move(pos, start_sq, end_sq):
+    """Apply a move to the bitboards in place; returns the old bitboard list for bb_unmake_move."""
+    undo = pos.bbs[:]
+    b = pos.bbs
+    from_bit = 1 << start_sq
+    to_bit = 1 << end_sq
+    for n in range(12):
+        if b[n] & to_bit:
+            b[n] ^= to_bit
+    for n in range(12):
+        if b[n] & from_bit:
+            b[n] ^= from_bit | to_bit
+            if n % 6 == 5 and abs(start_sq - end_sq) == 2:
+                # castling: move the rook too
+                rank = start_sq & ~7
+                if end_sq > start_sq:
+                    rook_move = (1 << (rank + 7)) | (1 << (rank + 5))
+                else:
+                    rook_move = (1 << rank) | (1 << (rank + 3))
+                if b[n-2] & (rook_move & ((1 << (rank + 7)) | (1 << rank))):
+                    b[n-2] ^= rook_move
+            elif n % 6 == 0 and (end_sq < 8 or end_sq >= 56):
+                # promotion to queen
+                b[n] ^= to_bit
+                b[n+4] |= to_bit
+            break
+    return undo
+
+def bb_unmake_move(pos, undo):
+    pos.bbs = undo
+
+def bb_generate_moves(piece, pos, bb_pos, ignore_check=False):
+    """generate_moves on a BitboardPosition; returns (i,j) targets like the list-board version."""
+    i, j = pos
+    sq = i*8 + j
+    color = piece[0]
+    enemy = 'b' if color == 'w' else 'w'
+    targets = bb_pseudo_targets(piece, sq, bb_pos, bb_pos.occupancy(color), bb_pos.occupancy(enemy))
+    moves = []
+    king_bb = BB_INDEX[color + 'K']
+    for t in iter_bits(targets):
+        if not ignore_check:
+            undo = bb_make_move(bb_pos, sq, t)
+            k = bb_pos.bbs[king_bb]
+            illegal = (not k) or bb_is_square_attacked((k & -k).bit_length() - 1, enemy, bb_pos)
+            bb_unmake_move(bb_pos, undo)
+            if illegal:
+                continue
+        moves.append((t >> 3, t & 7))
+    return moves
+
+def bb_get_all_moves_for_player(bb_pos, player):
+    moves = []
+    o = 0 if player == 'w' else 6
+    for n in range(o, o + 6):
+        piece = BB_PIECES[n]
+        for sq in iter_bits(bb_pos.bbs[n]):
+            start = (sq >> 3, sq & 7)
+            for m in bb_generate_moves(piece, start, bb_pos):
+                moves.append((start, m))
+    return moves
+
+def bb_evaluate(bb_pos):
+    """evaluate_board on bitboards (same terms: material, center, mobility, king safety)."""
+    score = 0.0
+    occ = {'w': bb_pos.occupancy('w'), 'b': bb_pos.occupancy('b')}
+    for n, bb in enumerate(bb_pos.bbs):
+        if not bb:
+            continue
+        piece = BB_PIECES[n]
+        color = piece[0]
+        own = occ[color]
+        enemy_occ = occ['b' if color == 'w' else 'w']
+        base = piece_values[piece[1]]
+        for sq in iter_bits(bb):
+            val = base
+            if (CENTER_BB >> sq) & 1:
+                val += 0.2
+            val += 0.02 * bb_pseudo_targets(piece, sq, bb_pos, own, enemy_occ).bit_count()
+            if piece[1] == 'K':
+                # the original 3x3 scan counts the king itself as well
+                allies_near = (KING_ATTACKS[sq] & own).bit_count() + 1
+                val -= (8 - allies_near) * 0.3
+            score += val if color == 'w' else -val
+    return score
+
+# -------------------------
+# Endgame tablebases
+# -------------------------
+TB_PROBE_PIECES = 5     # search probes the tables only below this many pieces at the root (incl. kings)
+
+_tablebases = None
+_tablebases_loaded = False
+
+def get_tablebases():
+    """The tables in TABLEBASE_DIR, loaded on first use; None if disabled or none are built."""
+    global _tablebases, _tablebases_loaded
+    if not _tablebases_loaded:
+        _tablebases_loaded = True
+        if USE_TABLEBASES:
+            tables = Tablebases(TABLEBASE_DIR)
+            _tablebases = tables if len(tables) else None
+    return _tablebases if USE_TABLEBASES else None
+
+def tablebases_for(temp_board):
+    """get_tablebases() if a search from this position can reach table positions, else None."""
+    tables = get_tablebases()
+    if tables is None:
+        return None
+    pieces = sum(1 for row in temp_board for p in row if p != '  ')
+    return tables if pieces <= TB_PROBE_PIECES else None
+
+def tablebase_score(result, side_to_move):
+    """Tablebases.probe() result -> search score from White's perspective.
+       Wins rank just below a mate on the board, shorter mates higher."""
+    wdl, plies = result
+    if wdl == WDL_WIN:
+        score = 9999 - plies
+    elif wdl == WDL_LOSS:
+        score = -(9999 - plies)
+    else:
+        return 0
+    return score if side_to_move == 'w' else -score
+
+def tablebase_move(temp_board, side_to_move, rights=None):
+    """
+    Best move straight from the tables: the fastest win, else a drawing move, else
+    the longest defence. None if the position is not covered.
+    """
+    tables = get_tablebases()
+    if tables is None or tables.probe(temp_board, side_to_move) is None:
+        return None
+    other = 'b' if side_to_move == 'w' else 'w'
+    best_move, best_rank = None, None
+    for start, end in get_all_moves_for_player(temp_board, side_to_move, rights):
+        undo = make_move(start, end, temp_board, rights)
+        result = tables.probe(temp_board, other)
+        unmake_move(temp_board, undo)
+        if result is None:
+            return None
+        wdl, plies = result
+        # ranked from the mover's side: opponent lost (sooner is better) < draw < opponent won (later is better)
+        rank = (0, plies) if wdl == WDL_LOSS else (2, -plies) if wdl == WDL_WIN else (1, 0)
+        if best_rank is None or rank < best_rank:
+            best_move, best_rank = (start, end), rank
+    return best_move
+
+# -------------------------
+# Minimax / negamax with alpha-beta, TT and time cutoff
+# -------------------------
+def move_order_key(temp_board, start, end):
+    # heuristic: captures (value captured higher first), promotions, then quiet
+    si,sj = start
+    ei,ej = end
+    captured = temp_board[ei][ej]
+    cap_value = 0
+    if captured != '  ':
+        cap_value = piece_values.get(captured[1], 0)
+    moving = temp_board[si][sj]
+    prom = 1 if (moving[1]=='P' and ( (moving[0]=='w' and ei==0) or (moving[0]=='b' and ei==7))) else 0
+    return (-cap_value, -prom)
+
+# -------------------------
+# Transposition table
+# -------------------------
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2   # score is exact / at least / at most the stored value
+TT_AGE_WEIGHT = 2       # each search an entry has gone unused counts like this many plies less depth
+TT_SNAPSHOT_MAGIC = b'CHTT'
+
+def pack_move(move):
+    """((si,sj),(ei,ej)) -> 12-bit int (from square << 6 | to square); None -> 0."""
+    if move is None:
+        return 0
+    (si,sj), (ei,ej) = move
+    return ((si*8 + sj) << 6) | (ei*8 + ej)
+
+def unpack_move(code):
+    """pack_move's inverse (also accepts move codes with flags); 0 -> None."""
+    code &= MOVE_SQUARES
+    return MOVE_PAIRS[code] if code else None
+
+def tt_flag_for(score, alpha, beta):
+    """Bound type of a search result for the window (alpha, beta) it was searched with."""
+    if score <= alpha:
+        return TT_UPPER
+    if score >= beta:
+        return TT_LOWER
+    return TT_EXACT
+
+class TranspositionTable:
+    """
+    Fixed-size transposition table in preallocated arrays (nothing is allocated per store).
+    Each bucket has two slots: slot 0 keeps the deepest entry, slot 1 is always replaced.
+    An entry is (depth, score, flag, packed move); flag is TT_EXACT, TT_LOWER or TT_UPPER.
+    The table can be kept across moves and games: call new_search() before each root
+    search, and entries not used for a while lose their claim on slot 0 (TT_AGE_WEIGHT).
+    save()/load() write and read a snapshot file.
+    """
+    SLOT_BYTES = 8 + 8 + 1 + 1 + 2 + 1   # key, score, depth, flag, move, age
+
+    def __init__(self, size_mb=TT_SIZE_MB):
+        # largest power-of-two bucket count that fits in size_mb
+        buckets = 1
+        while buckets * 2 * 2 * self.SLOT_BYTES <= size_mb * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        slots = buckets * 2
+        self.keys = array('Q', bytes(8 * slots))
+        self.scores = array('d', bytes(8 * slots))
+        self.depths = array('b', [-1]) * slots
+        self.flags = array('B', bytes(slots))
+        self.moves = array('H', bytes(2 * slots))
+        self.ages = array('B', bytes(slots))    # generation of the search that last used the entry
+        self.generation = 0
+        self.probes = self.hits = self.collisions = self.stores = 0
+
+    def new_search(self):
+        """Start a new root search: keep the entries but age them by one generation."""
+        self.generation = (self.generation + 1) & 0xFF
+        self.probes = self.hits = self.collisions = self.stores = 0
+
+    def probe(self, key):
+        """Return (depth, score, flag, packed_move) for key, or None."""
+        self.probes += 1
+        i = (key & self.mask) << 1
+        keys = self.keys
+        if keys[i] == key:
+            slot = i
+        elif keys[i+1] == key:
+            slot = i + 1
+        else:
+            if keys[i] or keys[i+1]:
+                # bucket holds other positions
+                self.collisions += 1
+            return None
+        self.hits += 1
+        self.ages[slot] = self.generation
+        return self.depths[slot], self.scores[slot], self.flags[slot], self.moves[slot]
+
+    def store(self, key, depth, score, flag, move):
+        self.stores += 1
+        i = (key & self.mask) << 1
+        keys = self.keys
+        depths = self.depths
+        age = (self.generation - self.ages[i]) & 0xFF
+        if keys[i] == key or depth >= depths[i] - TT_AGE_WEIGHT * age:
+            if keys[i] != key and keys[i]:
+                # demote the old deep entry to the always-replace slot
+                self._write(i + 1, keys[i], depths[i], self.scores[i], self.flags[i], self.moves[i])
+            self._write(i, key, depth, score, flag, move)
+        else:
+            self._write(i + 1, key, depth, score, flag, move)
+
+    def _write(self, slot, key, depth, score, flag, move, age=None):
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.scores[slot] = score
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.ages[slot] = self.generation if age is None else age
+
+    def _arrays(self):
+        return self.keys, self.scores, self.depths, self.flags, self.moves, self.ages
+
+    def save(self, path):
+        """Write the table to path (header, then each array as raw machine-order bytes)."""
+        with open(path, "wb") as f:
+            f.write(TT_SNAPSHOT_MAGIC)
+            # the start position's key identifies the Zobrist tables the entries were hashed with
+            f.write(struct.pack("<QQB", len(self.keys), board_key(initial_board, 'w', ALL_CASTLING),
+                                self.generation))
+            for a in self._arrays():
+                a.tofile(f)
+
+    def load(self, path):
+        """
+        Read a snapshot written by save(). A snapshot of another size is re-inserted entry
+        by entry. Returns False (table unchanged) if the file is missing or not a snapshot
+        from this engine.
+        """
+        header = struct.Struct("<QQB")
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(TT_SNAPSHOT_MAGIC)) != TT_SNAPSHOT_MAGIC:
+                    return False
+                slots, zobrist_check, generation = header.unpack(f.read(header.size))
+                if zobrist_check != board_key(initial_board, 'w', ALL_CASTLING):
+                    return False
+                saved = [array(a.typecode) for a in self._arrays()]
+                for a in saved:
+                    a.fromfile(f, slots)
+        except (OSError, EOFError, struct.error):
+            return False
+        if slots == len(self.keys):
+            self.keys, self.scores, self.depths, self.flags, self.moves, self.ages = saved
+            self.generation = generation
+        else:
+            keys, scores, depths, flags, moves, ages = saved
+            self.generation = generation
+            for n in range(slots):
+                if keys[n]:
+                    self.store(keys[n], depths[n], scores[n], flags[n], moves[n])
+            self.stores = 0
+        return True
+
+    def fill(self, sample=4096):
+        """Fraction of used slots, estimated from the first `sample` slots."""
+        n = min(sample, len(self.keys))
+        return sum(1 for k in self.keys[:n] if k) / n
+
+    def stats(self):
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'fill': self.fill(),
+        }
+
+def mvv_lva_key(temp_board, start, end):
+    # most valuable victim first, then least valuable attacker (promotion pushes count as a queen gain)
+    victim = temp_board[end[0]][end[1]]
+    gain = piece_values[victim[1]] if victim != '  ' else piece_values['Q']
+    return -gain * 10 + piece_values[temp_board[start[0]][start[1]][1]]
+
+def quiescence(temp_board, alpha, beta, side_to_move, stop_time, rights, key, material, info=None):
+    """
+    Captures/promotions-only search below the nominal depth so leaves are not scored in
+    the middle of an exchange. Stand-pat: the side to move may decline all captures.
+    Score is from White's perspective like minimax_tt.
+    """
+    if info is None:
+        info = SearchInfo()
+    return _quiescence(Position(temp_board, side_to_move, rights, key, material), alpha, beta, stop_time, info, 0)
+
+def _quiescence(pos, alpha, beta, stop_time, info, ply):
+    """quiescence() on a Position, with ply selecting info's move buffers."""
+    if info.expired(stop_time):
+        raise TimeoutError
+    info.qnodes += 1
+    temp_board, side_to_move = pos.board, pos.side
+    stand_pat = pos.evaluate()
+    if side_to_move == 'w':
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+    else:
+        if stand_pat <= alpha:
+            return stand_pat
+        beta = min(beta, stand_pat)
+
+    buf, scores = info.buffers(ply)
+    n = fill_moves(temp_board, side_to_move, buf, king=pos.kings[side_to_move], captures_only=True)
+    for x in range(n):
+        start, end = MOVE_PAIRS[buf[x] & MOVE_SQUARES]
+        scores[x] = -mvv_lva_key(temp_board, start, end)
+    best = stand_pat
+    for x in sorted(range(n), key=scores.__getitem__, reverse=True):
+        undo = pos.make(buf[x])
+        try:
+            val = _quiescence(pos, alpha, beta, stop_time, info, ply + 1)
+        finally:
+            pos.unmake(undo)
+        if side_to_move == 'w':
+            if val > best:
+                best = val
+            alpha = max(alpha, val)
+        else:
+            if val < best:
+                best = val
+            beta = min(beta, val)
+        if beta <= alpha:
+            break
+    return best
+
+MAX_PLY = 64            # killer slots are kept per ply from the root
+PVS_WINDOW = 0.001      # null-window width (scores move in steps of 0.02)
+
+class SearchInfo:
+    """Per-search move-ordering tables (killers, history), move buffers and node/cutoff counters.
+       Reuse one across the iterations of an iterative-deepening search.
+       tablebases: Tablebases to probe below the root (see tablebases_for), or None.
+       timer: TimeManager whose deadline may move while a depth is running (after a ponder
+       hit from another thread); the search also stops at that deadline.
+       cancel: an Event-like token (is_set()); once it is set the search stops as if out of time."""
+
+    def __init__(self, tablebases=None, timer=None, cancel=None):
+        self.tablebases = tablebases
+        self.timer = timer
+        self.cancel = cancel
+        self.polls = 0
+        self.nodes = 0
+        self.qnodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        # selective search: null-move cutoffs, reduced searches (and how many were redone
+        # at full depth), moves futility-pruned
+        self.null_cutoffs = 0
+        self.reductions = 0
+        self.re_searches = 0
+        self.futility_pruned = 0
+        # aspiration windows the root score fell outside of
+        self.aspiration_fails = 0
+        # (score, move) of the best root move proven so far in the running depth, kept so a
+        # depth cut short by the clock still counts; reset it before each depth
+        self.root_best = None
+        # killer move codes (12-bit, 0 = none)
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        # indexed by move code: from_square * 64 + to_square
+        self.history = {'w': [0] * 4096, 'b': [0] * 4096}
+        # one (move codes, ordering scores) pair per ply, allocated once and refilled
+        self.move_buffers = []
+
+    def buffers(self, ply):
+        """The move-code buffer and ordering-score buffer for a ply (quiescence plies included)."""
+        while len(self.move_buffers) <= ply:
+            self.move_buffers.append((move_buffer(), array('i', bytes(4 * MAX_MOVES))))
+        return self.move_buffers[ply]
+
+    def record_cutoff(self, code, side_to_move, depth, ply, move_index):
+        """Count a beta cutoff; quiet cutoff moves become killers and gain history."""
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+        if code & (MOVE_CAPTURE | MOVE_PROMOTION):
+            return
+        code &= MOVE_SQUARES
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != code:
+                killers[1] = killers[0]
+                killers[0] = code
+        self.history[side_to_move][code] += depth * depth
+
+    def expired(self, stop_time):
+        """True once stop_time or the timer's current deadline has passed or cancel is set.
+           Only every SEARCH_POLL_CALLS-th call looks; the search calls it at every node and move."""
+        self.polls += 1
+        if self.polls < SEARCH_POLL_CALLS:
+            return False
+        self.polls = 0
+        if self.cancel is not None and self.cancel.is_set():
+            return True
+        now = time.time()
+        return now > stop_time or (self.timer is not None and now > self.timer.deadline)
+
+    def stats(self):
+        return {
+            'nodes': self.nodes,
+            'qnodes': self.qnodes,
+            'cutoffs': self.cutoffs,
+            'first_move_cutoff_rate': self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+            'null_cutoffs': self.null_cutoffs,
+            'reductions': self.reductions,
+            're_searches': self.re_searches,
+            'futility_pruned': self.futility_pruned,
+            'aspiration_fails': self.aspiration_fails,
+        }
+
+def order_moves(temp_board, buf, scores, n, tt_move, info, ply, side_to_move):
+    """Hash move, then captures/promotions by MVV-LVA, then the two killers, then history.
+       Scores the move codes buf[:n] into scores and returns their indices in search order."""
+    killers = info.killers[ply] if ply < MAX_PLY else (0, 0)
+    history = info.history[side_to_move]
+    for x in range(n):
+        code = buf[x]
+        m = code & MOVE_SQUARES
+        if m == tt_move:
+            scores[x] = 10000000
+        elif code & (MOVE_CAPTURE | MOVE_PROMOTION):
+            start, end = MOVE_PAIRS[m]
+            scores[x] = 1000000 - mvv_lva_key(temp_board, start, end)
+        elif m == killers[0]:
+            scores[x] = 900000
+        elif m == killers[1]:
+            scores[x] = 800000
+        else:
+            scores[x] = min(history[m], 700000)
+    return sorted(range(n), key=scores.__getitem__, reverse=True)
+
+def minimax_tt(temp_board, depth, alpha, beta, side_to_move, stop_time, tt, rights=None, key=None, material=None,
+               info=None, ply=0):
+    """
+    Returns (score, best_move) from White's perspective (positive favors White).
+    side_to_move: 'w' or 'b'.
+    rights: castling rights of this position, updated during the search and restored (None = no castling).
+    tt is a TranspositionTable keyed by the Zobrist key, which is computed once at the
+    root and then updated incrementally by make_move (as is the material score).
+    Cutoff scores are stored as lower/upper bounds, only exact scores are returned as-is.
+    Principal-variation search: the first (best-ordered) move gets the full window, the
+    rest a null window and are re-searched only if they land inside (alpha, beta).
+    Selective search below the root, each part behind its own switch: null-move pruning
+    (USE_NULL_MOVE), late move reductions (USE_LMR) and futility pruning at depth 1
+    (USE_FUTILITY); none of them applies while the side to move is in check.
+    info: SearchInfo with killers/history and counters (a fresh one if None); ply: distance from root.
+    The search itself runs on a Position (see _minimax) with move codes in info's per-ply buffers.
+    Moves are made and taken back on temp_board itself, so it is unchanged on return
+    (also when TimeoutError is raised).
+    Will raise TimeoutError if time exceeded (stop_time or info.timer's deadline).
+    """
+    if info is None:
+        info = SearchInfo()
+    if info.expired(stop_time):
+        raise TimeoutError
+    if rights is None:
+        rights = dict(NO_CASTLING)
+    pos = Position(temp_board, side_to_move, rights, key, material)
+    return _minimax(pos, depth, alpha, beta, stop_time, tt, info, ply)
+
+def _minimax(pos, depth, alpha, beta, stop_time, tt, info, ply, allow_null=True):
+    """minimax_tt() on a Position; pos is back in its starting state on return.
+       allow_null is False right after a null move, so two are never made in a row."""
+    if info.expired(stop_time):
+        raise TimeoutError
+    temp_board, side_to_move, key = pos.board, pos.side, pos.hash
+    info.nodes += 1
+    if ply > 0 and info.tablebases is not None:
+        found = info.tablebases.probe(temp_board, side_to_move)
+        if found is not None:
+            return tablebase_score(found, side_to_move), None
+    alpha_orig, beta_orig = alpha, beta
+    tt_move = 0
+    entry = tt.probe(key)
+    if entry is not None:
+        tt_move = entry[3]
+        # at the root the entry only orders moves: a cutoff there would answer every depth
+        # up to the stored one in a single node and end iterative deepening on "stable" depths
+        if entry[0] >= depth and ply > 0:
+            _, tt_score, tt_flag, _ = entry
+            if tt_flag == TT_EXACT:
+                return tt_score, unpack_move(tt_move)
+            if tt_flag == TT_LOWER:
+                alpha = max(alpha, tt_score)
+            else:
+                beta = min(beta, tt_score)
+            if alpha >= beta:
+                return tt_score, unpack_move(tt_move)
+
+    maximizing = side_to_move == 'w'
+    other = 'b' if maximizing else 'w'
+    in_check = is_check(side_to_move, temp_board, pos.kings[side_to_move])
+    selective = ply > 0 and not in_check
+    static_eval = None
+    # neither pruning is tried against a mate (or tablebase) bound: those must be proven exactly
+    if (selective and USE_NULL_MOVE and allow_null and depth > NULL_MOVE_R
+            and abs(beta if maximizing else alpha) < 9000 and pos.has_pieces(side_to_move)):
+        static_eval = pos.evaluate()
+        if static_eval >= beta if maximizing else static_eval <= alpha:
+            # give the opponent a free move: if a shallower search still fails high, so would a real move
+            pos.make_null()
+            try:
+                if maximizing:
+                    val, _ = _minimax(pos, depth - 1 - NULL_MOVE_R, beta - PVS_WINDOW, beta, stop_time, tt, info,
+                                      ply + 1, False)
+                else:
+                    val, _ = _minimax(pos, depth - 1 - NULL_MOVE_R, alpha, alpha + PVS_WINDOW, stop_time, tt, info,
+                                      ply + 1, False)
+            finally:
+                pos.unmake_null()
+            if val >= beta if maximizing else val <= alpha:
+                info.null_cutoffs += 1
+                return (beta if maximizing else alpha), None
+
+    buf, scores = info.buffers(ply)
+    n = fill_moves(temp_board, side_to_move, buf, pos.castling_rights, pos.kings[side_to_move])
+    if depth == 0 or n == 0:
+        if n == 0:
+            if in_check:
+                # side_to_move is checkmated -> very bad for that side
+                score = (-9999 if side_to_move == 'w' else 9999)
+                return score, None
+            else:
+                return 0, None
+        if USE_QUIESCENCE:
+            return _quiescence(pos, alpha, beta, stop_time, info, ply), None
+        return pos.evaluate(), None
+
+    futile = False
+    if selective and USE_FUTILITY and depth == 1 and abs(alpha if maximizing else beta) < 9000:
+        if static_eval is None:
+            static_eval = pos.evaluate()
+        futile = static_eval + FUTILITY_MARGIN <= alpha if maximizing else static_eval - FUTILITY_MARGIN >= beta
+    reduce_late = selective and USE_LMR and depth >= LMR_MIN_DEPTH
+
+    best_score = -99999 if maximizing else 99999
+    best_code = 0
+    for num, x in enumerate(order_moves(temp_board, buf, scores, n, tt_move, info, ply, side_to_move)):
+        if info.expired(stop_time):
+            raise TimeoutError
+        code = buf[x]
+        quiet = num > 0 and not code & (MOVE_CAPTURE | MOVE_PROMOTION)
+        pruned = False
+        # make move in place (castling/promotion handled by make_move), always take it back
+        undo = pos.make(code)
+        child = (stop_time, tt, info, ply + 1)
+        try:
+            if quiet and (futile or (reduce_late and num >= LMR_MIN_MOVE)):
+                # checks are never pruned or reduced
+                quiet = not is_check(other, temp_board, pos.kings[other])
+            if futile and quiet:
+                pruned = True
+            elif num == 0:
+                val, _ = _minimax(pos, depth-1, alpha, beta, *child)
+            else:
+                reduced = quiet and reduce_late and num >= LMR_MIN_MOVE
+                if reduced:
+                    info.reductions += 1
+                # null window around the bound this side is trying to improve, one ply
+                # shallower for a late quiet move; redo at full depth if it beats the bound
+                for d in ((depth-2, depth-1) if reduced else (depth-1,)):
+                    if maximizing:
+                        val, _ = _minimax(pos, d, alpha, alpha + PVS_WINDOW, *child)
+                        if val <= alpha:
+                            break
+                    else:
+                        val, _ = _minimax(pos, d, beta - PVS_WINDOW, beta, *child)
+                        if val >= beta:
+                            break
+                    if d < depth-1:
+                        info.re_searches += 1
+                if alpha < val < beta:
+                    val, _ = _minimax(pos, depth-1, alpha, beta, *child)
+        finally:
+            pos.unmake(undo)
+        if pruned:
+            # assume the move gains at most FUTILITY_MARGIN over the static eval (still outside the window)
+            info.futility_pruned += 1
+            if maximizing:
+                best_score = max(best_score, static_eval + FUTILITY_MARGIN)
+            else:
+                best_score = min(best_score, static_eval - FUTILITY_MARGIN)
+            continue
+        if maximizing:
+            if val > best_score:
+                best_score = val
+                best_code = code
+            alpha = max(alpha, val)
+        else:
+            if val < best_score:
+                best_score = val
+                best_code = code
+            beta = min(beta, val)
+        if ply == 0 and best_code == code and (val > alpha_orig if maximizing else val < beta_orig):
+            # inside the window: really better than every root move searched before it
+            info.root_best = (val, MOVE_PAIRS[code & MOVE_SQUARES])
+        if beta <= alpha:
+            info.record_cutoff(code, side_to_move, depth, ply, num)
+            break
+    best_code &= MOVE_SQUARES
+    tt.store(key, depth, best_score, tt_flag_for(best_score, alpha_orig, beta_orig), best_code)
+    return best_score, MOVE_PAIRS[best_code] if best_code else None
+
+def principal_variation(temp_board, side_to_move, rights, tt, max_len=MAX_PLY):
+    """Follow the TT's stored best moves from this position: the expected line of play.
+       Each move is checked for legality; stops at a missing entry or a repeated position.
+       temp_board and rights are restored before returning."""
+    key = board_key(temp_board, side_to_move, rights)
+    line, undos, seen = [], [], set()
+    side = side_to_move
+    # these lookups are not search probes; keep them out of the hit-rate counters
+    probes, hits = tt.probes, tt.hits
+    try:
+        while len(line) < max_len and key not in seen:
+            seen.add(key)
+            entry = tt.probe(key)
+            move = unpack_move(entry[3]) if entry is not None else None
+            if move is None or move not in get_all_moves_for_player(temp_board, side, rights):
+                break
+            undo = make_move(move[0], move[1], temp_board, rights, key)
+            undos.append(undo)
+            line.append(move)
+            key = undo[-1]
+            side = 'w' if side == 'b' else 'b'
+    finally:
+        for undo in reversed(undos):
+            unmake_move(temp_board, undo)
+        tt.probes, tt.hits = probes, hits
+    return line
+
+def depth_report(depth, score, best_move, started, nodes, tt_probes, tt_hits, tt_fill, pv=None):
+    """Summary of one finished iterative-deepening depth, as passed to on_depth callbacks.
+       nodes and TT counts are running totals since the search started; pv is the
+       expected line starting with best_move (just [best_move] when not available)."""
+    elapsed = time.time() - started
+    if not pv:
+        pv = [best_move] if best_move else []
+    return {
+        'depth': depth,
+        'score': score,
+        'move': best_move,
+        'pv': pv,
+        'nodes': nodes,
+        'time': elapsed,
+        'nps': nodes / elapsed if elapsed > 0 else 0.0,
+        'tt_hit_rate': tt_hits / tt_probes if tt_probes else 0.0,
+        'tt_fill': tt_fill,
+    }
+
+# -------------------------
+# Time management
+# -------------------------
+TIME_SAFETY = 0.3       # seconds kept in reserve on a game clock for move overhead
+
+def clock_budget(remaining, increment=0.0):
+    """(normal, maximum) seconds to spend on one move with `remaining` seconds on the clock."""
+    reserve = max(0.0, remaining - TIME_SAFETY)
+    normal = min(remaining / TIME_MOVES_TO_GO + increment * 0.8, reserve * 0.2)
+    maximum = min(normal * TIME_EXTEND_FACTOR, reserve * 0.4)
+    return max(0.05, normal), max(0.05, maximum)
+
+class TimeManager:
+    """
+    Time control for one iterative-deepening search. deadline is what the running depth
+    is searched against; call next_depth() after every finished depth to learn whether
+    to start another one. side is the side searching (scores are from White's view).
+    A pondering manager has no deadline until ponderhit() starts its clock.
+    """
+
+    def __init__(self, budget=None, maximum=None, side='b', pondering=False):
+        if budget is None:
+            budget = HARD_TIME_LIMIT
+        if maximum is None:
+            maximum = budget * TIME_EXTEND_FACTOR
+        self.side = side
+        self.pondering = pondering
+        self.started = time.time()
+        self.budget = budget
+        self.maximum = maximum
+        self.deadline = float('inf') if pondering else self.started + budget
+        self.best_move = None
+        self.stable = 0
+        self.last_score = None
+
+    @classmethod
+    def for_clock(cls, clock=None, side='b', pondering=False):
+        """Manager for one move: clock is (remaining, increment) in seconds, None = HARD_TIME_LIMIT."""
+        if clock is None:
+            return cls(side=side, pondering=pondering)
+        return cls(*clock_budget(*clock), side=side, pondering=pondering)
+
+    def ponderhit(self, clock=None):
+        """
+        The pondered move was played: switch to the normal move budget (may be called from
+        another thread). Time already spent pondering counts, so after a long ponder the
+        running depth stops at once and the deepest finished one is played.
+        """
+        if clock is None:
+            budget, maximum = HARD_TIME_LIMIT, HARD_TIME_LIMIT * TIME_EXTEND_FACTOR
+        else:
+            budget, maximum = clock_budget(*clock)
+        self.budget, self.maximum = budget, maximum
+        self.pondering = False
+        self.deadline = max(self.started + budget, time.time())
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def next_depth(self, depth, score, best_move):
+        """Record a finished depth; False when the search should stop here."""
+        if best_move == self.best_move:
+            self.stable += 1
+        else:
+            self.best_move, self.stable = best_move, 1
+        if self.last_score is not None:
+            drop = score - self.last_score if self.side == 'b' else self.last_score - score
+            if drop >= TIME_SCORE_DROP:
+                # the line we liked just got worse: give the search more time to find a fix
+                self.deadline = max(self.deadline, self.started + self.maximum)
+                self.stable = 0
+        self.last_score = score
+        if self.pondering:
+            return True
+        # depth 1 alone proves little, so at least TIME_STABLE_DEPTHS + 1 depths are searched;
+        # cheap early depths agree easily, so a stable move only ends the search once it has
+        # had a fair share of its budget
+        if (self.stable >= TIME_STABLE_DEPTHS and depth > TIME_STABLE_DEPTHS
+                and self.elapsed() >= self.budget * TIME_STABLE_SHARE):
+            return False
+        # a depth usually takes longer than all earlier ones together; don't start one that cannot finish
+        return self.elapsed() < (self.deadline - self.started) / 2
+
+def aspiration_window(score):
+    """(alpha, beta) for the next depth: ASPIRATION_WINDOW either side of the previous
+       depth's score, full width for the first depth and around mate scores."""
+    if score is None or abs(score) >= 9000:
+        return -99999, 99999
+    return score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+
+def widen_window(score, alpha, beta):
+    """
+    The window to search again with when score fell outside (alpha, beta), or None if it
+    is inside (or the window was already full). The failing side moves ASPIRATION_GROWTH
+    times its previous distance past score; the other side stays.
+    """
+    if alpha < score < beta:
+        return None
+    if score <= alpha and alpha > -99999:
+        delta = (beta - alpha) / 2 * ASPIRATION_GROWTH
+        return (score - delta if delta < 9 else -99999), beta
+    if score >= beta and beta < 99999:
+        delta = (beta - alpha) / 2 * ASPIRATION_GROWTH
+        return alpha, (score + delta if delta < 9 else 99999)
+    return None
+
+def iterative_deepening(board_snapshot, rights, timer, tt, info, is_aborted=None, on_depth=None):
+    """
+    In-thread Hard search for Black: depth 1, 2, ... until timer.next_depth() says stop,
+    HARD_MAX_DEPTH is done, is_aborted() returns True or the timer's deadline cuts a
+    depth short. Each depth after the first starts in an aspiration window around the
+    previous score (see widen_window). info.timer should be timer. Returns the best move
+    of the deepest finished depth, or the better root move a depth cut short had already
+    proven (or None).
+    """
+    best_move_overall = None
+    score = None
+    for depth in range(1, HARD_MAX_DEPTH+1):
+        if is_aborted is not None and is_aborted():
+            break
+        alpha, beta = aspiration_window(score)
+        info.root_best = None
+        try:
+            while True:
+                score, best = minimax_tt(board_snapshot, depth, alpha, beta, 'b', timer.deadline, tt,
+                                         rights, info=info)
+                window = widen_window(score, alpha, beta)
+                if window is None:
+                    break
+                info.aspiration_fails += 1
+                alpha, beta = window
+        except TimeoutError:
+            if info.root_best is not None:
+                best_move_overall = info.root_best[1]
+            break
+        if on_depth is not None:
+            on_depth(depth_report(depth, score, best, timer.started, info.nodes + info.qnodes,
+                                  tt.probes, tt.hits, tt.fill(),
+                                  principal_variation(board_snapshot, 'b', rights, tt, depth)))
+        if best:
+            best_move_overall = best
+        if not timer.next_depth(depth, score, best):
+            break
+    return best_move_overall
+
+# -------------------------
+# Root-parallel search (process pool)
+# -------------------------
+# Workers are spawned: each imports this module and re-runs the top level of the script
+# that started the pool as __mp_main__ (but not its __main__ block), so a GUI script must
+# keep its windows and large state under that guard.
+_search_pool = None
+_pool_abort = None
+_worker_abort = None
+_worker_tt = None
+_worker_info = None
+_worker_root_key = None
+
+def _init_search_worker(abort_event):
+    global _worker_abort
+    _worker_abort = abort_event
+
+def get_search_pool():
+    """Create the search process pool on first use and keep it for the rest of the session."""
+    global _search_pool, _pool_abort
+    if _search_pool is None:
+        # imported here so that importing the engine stays cheap
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        ctx = multiprocessing.get_context('spawn')
+        _pool_abort = ctx.Event()
+        _search_pool = ProcessPoolExecutor(max_workers=SEARCH_PROCESSES, mp_context=ctx,
+                                           initializer=_init_search_worker, initargs=(_pool_abort,))
+    return _search_pool
+
+def search_root_moves(board_snapshot, rights, root_moves, depth, stop_time, want_pv=False, alpha=-99999, beta=99999):
+    """
+    Pool task: alpha-beta over a subset of Black's root moves at the given depth, in the
+    window (alpha, beta). Returns (score, best_move, counters) for the subset, or None if
+    an abort interrupted it. When stop_time interrupts it, counters['complete'] is False
+    and best_move is the best move searched so far inside the window (None if there was
+    none); counters['searched'] counts the root moves finished either way.
+    Each worker process keeps its own TT across depths and moves (aged by new_search()
+    whenever the root position changes); counters are this worker's running node and TT
+    totals for the current search, plus the principal variation after best_move when
+    want_pv is set.
+    """
+    global _worker_tt, _worker_info, _worker_root_key
+    key = board_key(board_snapshot, 'b', rights)
+    if _worker_tt is None:
+        _worker_tt = TranspositionTable()
+    if key != _worker_root_key:
+        _worker_tt.new_search()
+        _worker_info = SearchInfo(tablebases_for(board_snapshot), cancel=_worker_abort)
+        _worker_root_key = key
+    material = material_score(board_snapshot)
+    best_score, best_move = 99999, None
+    complete = True
+    searched = 0
+    bound = beta
+    try:
+        for start, end in root_moves:
+            if _worker_abort is not None and _worker_abort.is_set():
+                return None
+            undo = make_move(start, end, board_snapshot, rights, key, material)
+            try:
+                val, _ = minimax_tt(board_snapshot, depth-1, alpha, bound, 'w', stop_time, _worker_tt,
+                                    rights, undo[-1], undo[-2], _worker_info, 1)
+            finally:
+                unmake_move(board_snapshot, undo)
+            searched += 1
+            if val < best_score:
+                best_score, best_move = val, (start, end)
+            bound = min(bound, val)
+            if bound <= alpha:
+                break   # fails below the window: the caller searches again anyway
+    except TimeoutError:
+        complete = False
+        if best_score >= beta:
+            best_move = None
+    pv = None
+    if want_pv and best_move is not None:
+        undo = make_move(best_move[0], best_move[1], board_snapshot, rights)
+        pv = [best_move] + principal_variation(board_snapshot, 'w', rights, _worker_tt, depth - 1)
+        unmake_move(board_snapshot, undo)
+    counters = {
+        'pid': os.getpid(),
+        'complete': complete,
+        'searched': searched,
+        'pv': pv,
+        'nodes': _worker_info.nodes + _worker_info.qnodes,
+        'tt_probes': _worker_tt.probes,
+        'tt_hits': _worker_tt.hits,
+        'tt_fill': _worker_tt.fill(),
+    }
+    return best_score, best_move, counters
+
+def parallel_root_search(board_snapshot, rights, moves, timer, is_aborted=None, on_depth=None):
+    """
+    Iterative deepening for Black with the root moves split across SEARCH_PROCESSES workers,
+    each depth after the first in an aspiration window like iterative_deepening. timer
+    (a TimeManager) decides when to stop; the search also stops when is_aborted() returns True.
+    on_depth, if given, is called with a depth_report() after each finished depth.
+    Returns the best move of the deepest finished depth, or a better one from a depth the
+    clock cut short once the previous best move had been searched at it (or None).
+    """
+    from concurrent.futures import wait
+    if is_aborted is None:
+        is_aborted = lambda: False
+    started = timer.started
+    pool = get_search_pool()
+    _pool_abort.clear()
+    ordered = sorted(moves, key=lambda m: move_order_key(board_snapshot, m[0], m[1]))
+    best_move_overall = None
+    worker_counters = {}
+    score = None
+    for depth in range(1, HARD_MAX_DEPTH+1):
+        if is_aborted():
+            break
+        stop_time = timer.deadline
+        alpha, beta = aspiration_window(score)
+        # round-robin so every worker gets a share of the well-ordered moves
+        chunks = [ordered[k::SEARCH_PROCESSES] for k in range(SEARCH_PROCESSES)]
+        while True:
+            futures = [pool.submit(search_root_moves, board_snapshot, rights, c, depth, stop_time,
+                                   on_depth is not None, alpha, beta)
+                       for c in chunks if c]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=0.05)
+                if is_aborted():
+                    # wait for the tasks to see the abort: the next search clears the event,
+                    # and a task that missed it would run on to its old stop_time in a pool slot
+                    _pool_abort.set()
+                    wait(pending)
+                    return best_move_overall
+            results = [f.result() for f in futures]
+            if any(r is None for r in results):
+                return best_move_overall
+            score, best, best_counters = min(results, key=lambda r: r[0])
+            if not all(r[2]['complete'] for r in results):
+                break
+            window = widen_window(score, alpha, beta)
+            if window is None:
+                break
+            alpha, beta = window
+        if not all(r[2]['complete'] for r in results):
+            # ran out of time mid-iteration: the first chunk starts with the previous best
+            # move, so once that has a result anything better is safe to play
+            if results[0][2]['searched'] and best is not None and score < beta:
+                best_move_overall = best
+            break
+        if on_depth is not None:
+            # counters are running totals per process; one process may run several chunks
+            for r in results:
+                prev = worker_counters.get(r[2]['pid'])
+                if prev is None or r[2]['nodes'] >= prev['nodes']:
+                    worker_counters[r[2]['pid']] = r[2]
+            totals = worker_counters.values()
+            on_depth(depth_report(depth, score, best, started,
+                                  sum(c['nodes'] for c in totals),
+                                  sum(c['tt_probes'] for c in totals),
+                                  sum(c['tt_hits'] for c in totals),
+                                  sum(c['tt_fill'] for c in totals) / len(worker_counters),
+                                  best_counters['pv']))
+        if best:
+            best_move_overall = best
+            # search the previous best first next time
+            ordered.remove(best)
+            ordered.insert(0, best)
+        if not timer.next_depth(depth, score, best):
+            break
+    return best_move_overall
+
+# -------------------------
+# Move choice per difficulty
+# -------------------------
+def choose_move(board_snapshot, difficulty, rights=None, is_aborted=None, on_depth=None, clock=None, tt=None,
+                cancel=None):
+    """
+    Pick Black's move for the given difficulty ("Easy", "Medium" or "Hard").
+    Returns (start, end), or (None, None) when Black has no legal move.
+    is_aborted: optional callable polled between iterations; when it returns True the
+    Hard search stops and the best move found so far is returned.
+    cancel: optional Event-like token (see SearchController); setting it stops a Medium or
+    Hard search within SEARCH_POLL_CALLS checks. It also serves as is_aborted if that is None.
+    on_depth: optional callable given a depth_report() dict after every finished search
+    depth (Hard: each iteration; Medium: its single fixed-depth search).
+    clock: Black's (remaining, increment) in seconds on a game clock; Hard then budgets
+    its time from it (see TimeManager) instead of using HARD_TIME_LIMIT.
+    tt: TranspositionTable kept across calls (moves, games, pondering): Medium and Hard
+    search with it, Hard in-thread even if SEARCH_PROCESSES > 1. A fresh one per call if None.
+    board_snapshot is searched in place and restored before returning.
+    """
+    if rights is None:
+        rights = dict(NO_CASTLING)
+    if is_aborted is None:
+        is_aborted = cancel.is_set if cancel is not None else lambda: False
+    moves = get_all_moves_for_player(board_snapshot, 'b', rights)
+    if not moves:
+        return None, None
+    if len(moves) == 1:
+        return moves[0]
+
+    # Easy: random
+    if difficulty == "Easy":
+        return random.choice(moves)
+
+    # Medium/Hard: a covered endgame is played straight from the tables
+    tb_move = tablebase_move(board_snapshot, 'b', rights)
+    if tb_move is not None:
+        return tb_move
+
+    # Medium: prefer captures; else shallow search
+    if difficulty == "Medium":
+        capture_moves = [m for m in moves if board_snapshot[m[1][0]][m[1][1]] != '  ']
+        if capture_moves:
+            return random.choice(capture_moves)
+        try:
+            if tt is None:
+                tt = TranspositionTable()
+            else:
+                tt.new_search()
+            info = SearchInfo(tablebases_for(board_snapshot), cancel=cancel)
+            started = time.time()
+            score, best = minimax_tt(board_snapshot, MEDIUM_DEPTH, -99999, 99999, 'b', started+1.0, tt, rights,
+                                     info=info)
+            if on_depth is not None:
+                on_depth(depth_report(MEDIUM_DEPTH, score, best, started, info.nodes + info.qnodes,
+                                      tt.probes, tt.hits, tt.fill(),
+                                      principal_variation(board_snapshot, 'b', rights, tt, MEDIUM_DEPTH)))
+            if best is not None:
+                return best
+        except TimeoutError:
+            pass
+        return random.choice(moves)
+
+    # Hard: iterative deepening, timed by a TimeManager
+    timer = TimeManager.for_clock(clock)
+    best_move_overall = None
+    try:
+        if SEARCH_PROCESSES > 1 and tt is None:
+            best_move_overall = parallel_root_search(board_snapshot, rights, moves, timer, is_aborted,
+                                                     on_depth)
+        else:
+            if tt is None:
+                tt = TranspositionTable()
+            else:
+                tt.new_search()
+            info = SearchInfo(tablebases_for(board_snapshot), timer, cancel)
+            best_move_overall = iterative_deepening(board_snapshot, rights, timer, tt, info, is_aborted, on_depth)
+    except Exception as e:
+        print("AI search unexpected exception:", e, file=sys.stderr)
+
+    if best_move_overall is None:
+        best_move_overall = random.choice(moves)
+    return best_move_overall
+
+# -------------------------
+# Pondering
+# -------------------------
+def predicted_reply(temp_board, rights, tt):
+    """White's expected reply in this position (White to move) from the TT of Black's last search, or None."""
+    line = principal_variation(temp_board, 'w', rights, tt, 1)
+    return line[0] if line else None
+
+class PonderSearch:
+    """
+    Black's Hard search on the position after White's predicted reply, run while White is
+    still thinking. run() searches in the calling thread without a time limit; hit() turns
+    it into a normal timed search once White really plays the predicted move, and setting
+    the cancel token given to run() abandons it (the TT it warmed up stays usable). The
+    in-thread search is used whatever SEARCH_PROCESSES is.
+    """
+
+    def __init__(self, board_snapshot, rights, predicted, tt):
+        self.board = [row[:] for row in board_snapshot]
+        self.rights = dict(rights)
+        make_move_on_board(predicted[0], predicted[1], self.board, rights=self.rights)
+        # board and rights are changed in place while the search runs; matches() uses this
+        self.key = board_key(self.board, 'b', self.rights)
+        self.predicted = predicted
+        self.tt = tt
+        tt.new_search()
+        self.timer = TimeManager(pondering=True)
+        self.info = SearchInfo(tablebases_for(self.board), self.timer)
+        self.best_move = None
+        self.finished = False
+        self.was_hit = False
+        self._lock = threading.Lock()
+
+    def matches(self, temp_board, rights):
+        """True if temp_board/rights is the position this search is pondering."""
+        return board_key(temp_board, 'b', rights) == self.key
+
+    def run(self, on_depth=None, cancel=None):
+        """Search until hit() runs out its time or cancel (an Event-like token, e.g. from
+           SearchController) is set. True if the result should be played."""
+        self.info.cancel = cancel
+        moves = get_all_moves_for_player(self.board, 'b', self.rights)
+        best = None
+        if moves:
+            best = tablebase_move(self.board, 'b', self.rights)
+            if best is None and len(moves) > 1:
+                best = iterative_deepening(self.board, self.rights, self.timer, self.tt, self.info,
+                                           on_depth=on_depth)
+            if best is None:
+                best = moves[0] if len(moves) == 1 else random.choice(moves)
+        with self._lock:
+            self.best_move = best
+            self.finished = True
+            return self.was_hit
+
+    def hit(self, clock=None):
+        """
+        White played the predicted move. Returns True if the search is already over, in which
+        case best_move is the answer; otherwise the thread running run() gets the normal
+        move budget from now on and its run() returns True.
+        """
+        with self._lock:
+            self.was_hit = True
+            if self.finished:
+                return True
+            self.timer.ponderhit(clock)
+            return False
+
+# -------------------------
+# Background search control
+# -------------------------
+class SearchController:
+    """
+    Runs one background search at a time for a GUI. start() first stops and joins the
+    search already running, then calls search(cancel) in a new thread, where cancel is a
+    threading.Event for that search to pass on (choose_move(cancel=...),
+    PonderSearch.run(cancel=...)). Every start() and stop() begins a new generation; a
+    result is handed to on_result(generation, result) only if its search was not stopped,
+    and whoever applies it later should drop it unless is_current(generation) still holds.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self._cancel = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, search, on_result=None):
+        """Run search(cancel) in a background thread; returns the search's generation."""
+        self.stop()
+        with self._lock:
+            self.generation += 1
+            generation = self.generation
+            self._cancel = cancel = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(search, cancel, generation, on_result),
+                                            daemon=True)
+            self._thread.start()
+        return generation
+
+    def _run(self, search, cancel, generation, on_result):
+        result = search(cancel)
+        if on_result is not None and not cancel.is_set():
+            on_result(generation, result)
+
+    def is_current(self, generation):
+        """True if generation is the latest search and it has not been stopped."""
+        return generation == self.generation and self._cancel is not None and not self._cancel.is_set()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, timeout=None):
+        """Cancel the running search (its result is dropped) and wait up to timeout seconds
+           (None = until it has finished) for its thread. True once no search is running."""
+        with self._lock:
+            if self._cancel is not None:
+                self._cancel.set()
+            self.generation += 1
+        return self.join(timeout)
+
+    def join(self, timeout=None):
+        """Wait for the running search to finish on its own; True once no search is running."""
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        return not self.running()
@@ -0,0 +1,89 @@
+"""
+Opening book: a sorted binary file of (position hash, move, weight) records.
+
+Each record is 12 bytes, big-endian: the position's Zobrist key (chess_engine.board_key,
+so castling rights and side to move are part of it), the move packed as
+from_square << 6 | to_square (chess_engine.pack_move) and a 16-bit weight. Records are
+sorted by key, so a lookup is a binary search over the memory-mapped file with no
+parsing at load time. Build a book with build_book.py.
+
+    book = OpeningBook("book.bin")
+    move = book.choose(board, 'b', castling_rights)   # None when out of book
+"""
+
+import mmap
+import random
+import struct
+
+from chess_engine import board_key, unpack_move, get_all_moves_for_player
+
+RECORD = struct.Struct(">QHH")   # key, packed move, weight
+KEY = struct.Struct(">Q")
+
+
+def write_book(entries, path):
+    """Write {(key, packed_move): weight} as a sorted book file; weights are capped at 65535."""
+    with open(path, "wb") as f:
+        for (key, move), weight in sorted(entries.items()):
+            f.write(RECORD.pack(key, move, min(weight, 0xFFFF)))
+
+
+class OpeningBook:
+    """Read-only view of a book file. Raises OSError if the file cannot be opened."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            # mmap cannot map an empty file; an empty book just never hits
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self.data = b""
+        self.count = len(self.data) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = b""
+        self.count = 0
+
+    def _first_index(self, key):
+        """Index of the first record whose key is >= key."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(self.data, mid * RECORD.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entries(self, key):
+        """[(move, weight)] stored for a position key."""
+        result = []
+        i = self._first_index(key)
+        while i < self.count:
+            k, move, weight = RECORD.unpack_from(self.data, i * RECORD.size)
+            if k != key:
+                break
+            result.append((unpack_move(move), weight))
+            i += 1
+        return result
+
+    def moves(self, temp_board, side, rights=None):
+        """Book moves for the position that are legal on temp_board, as [(move, weight)]."""
+        found = self.entries(board_key(temp_board, side, rights))
+        if not found:
+            return []
+        legal = set(get_all_moves_for_player(temp_board, side, rights))
+        return [(m, w) for m, w in found if m in legal and w > 0]
+
+    def choose(self, temp_board, side, rights=None, rng=random):
+        """A weighted-random book move ((start, end)), or None when the position is not in the book."""
+        found = self.moves(temp_board, side, rights)
+        if not found:
+            return None
+        return rng.choices([m for m, _ in found], weights=[w for _, w in found])[0]
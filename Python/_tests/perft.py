@@ -0,0 +1,132 @@
+"""
+Perft: count the leaf nodes of the legal move tree to a fixed depth and time it.
+
+Checks chess_engine's move generator against the published counts for the start
+position and the standard test positions, and gives a nodes/sec baseline to track
+engine changes against. The engine plays neither en passant nor underpromotion, so
+a position whose tree reaches one of those is reported as FLAGGED, not FAIL.
+
+    python perft.py                 # all standard positions to depth 3
+    python perft.py --depth 4
+    python perft.py --divide --fen "<fen>" --depth 2
+"""
+
+import argparse
+import sys
+import time
+
+from chess_engine import (
+    board_from_fen, get_all_moves_for_player, make_move, unmake_move, move_name,
+)
+
+# name, FEN, known node counts for depth 1, 2, 3, ...
+POSITIONS = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def note_missing(temp_board, side, moves, ep_pawn, missing):
+    """Record engine features the true move list here would need (en passant, underpromotion)."""
+    for (si, sj), (ei, ej) in moves:
+        if temp_board[si][sj][1] == 'P' and ei in (0, 7):
+            missing.add('underpromotion')
+            break
+    if ep_pawn is not None:
+        r, c = ep_pawn
+        for dc in (-1, 1):
+            if 0 <= c + dc < 8 and temp_board[r][c + dc] == side + 'P':
+                missing.add('en passant')
+
+
+def perft(temp_board, side, rights, depth, ep_pawn=None, missing=None):
+    """Leaf count of the legal move tree; ep_pawn is the square of a pawn that just moved two."""
+    moves = get_all_moves_for_player(temp_board, side, rights)
+    if missing is not None:
+        note_missing(temp_board, side, moves, ep_pawn, missing)
+    if depth == 1:
+        return len(moves)
+    other = 'b' if side == 'w' else 'w'
+    nodes = 0
+    for start, end in moves:
+        double_push = temp_board[start[0]][start[1]][1] == 'P' and abs(start[0] - end[0]) == 2
+        undo = make_move(start, end, temp_board, rights)
+        nodes += perft(temp_board, other, rights, depth - 1, end if double_push else None, missing)
+        unmake_move(temp_board, undo)
+    return nodes
+
+
+def divide(temp_board, side, rights, depth):
+    """Per-root-move leaf counts as (move name, nodes)."""
+    other = 'b' if side == 'w' else 'w'
+    result = []
+    for start, end in get_all_moves_for_player(temp_board, side, rights):
+        undo = make_move(start, end, temp_board, rights)
+        nodes = perft(temp_board, other, rights, depth - 1) if depth > 1 else 1
+        unmake_move(temp_board, undo)
+        result.append((move_name((start, end)), nodes))
+    return sorted(result)
+
+
+def run_position(name, fen, expected, depth, show_divide=False):
+    """Run perft 1..depth on one position, print a line per depth; return the number of failures."""
+    temp_board, side, rights, ep_square = board_from_fen(fen)
+    # the pawn that made the double push sits one rank past the en passant square
+    ep_pawn = None
+    if ep_square is not None:
+        ep_pawn = (ep_square[0] + (1 if side == 'w' else -1), ep_square[1])
+    failures = 0
+    for d in range(1, depth + 1):
+        missing = set()
+        t = time.perf_counter()
+        nodes = perft(temp_board, side, rights, d, ep_pawn, missing)
+        elapsed = time.perf_counter() - t
+        known = expected[d - 1] if d <= len(expected) else None
+        if known is None:
+            status = "-"
+        elif nodes == known:
+            status = "OK"
+        elif missing:
+            status = "FLAGGED (needs %s)" % ", ".join(sorted(missing))
+        else:
+            status = "FAIL"
+            failures += 1
+        nps = nodes / elapsed if elapsed > 0 else 0
+        print("%-10s depth %d  nodes %10d  expected %10s  %7.2fs  %9.0f nps  %s"
+              % (name, d, nodes, known if known is not None else "?", elapsed, nps, status))
+    if show_divide:
+        for move, nodes in divide(temp_board, side, rights, depth):
+            print("  %s: %d" % (move, nodes))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depth", type=int, default=3, help="maximum depth (default 3)")
+    parser.add_argument("--fen", help="run only this position (no known counts)")
+    parser.add_argument("--position", help="run only the named standard position")
+    parser.add_argument("--divide", action="store_true", help="print per-move node counts at the maximum depth")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        positions = [("fen", args.fen, [])]
+    else:
+        positions = [p for p in POSITIONS if args.position in (None, p[0])]
+    failures = 0
+    for name, fen, expected in positions:
+        failures += run_position(name, fen, expected, args.depth, args.divide)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
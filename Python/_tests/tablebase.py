@@ -0,0 +1,136 @@
+"""
+Endgame tablebases for king + one piece against a bare king (KQK, KRK, KPK).
+
+Every table covers all placements of the strong king, weak king and the one extra piece
+with either side to move: index = ((stm * 64 + strong_king) * 64 + weak_king) * 64 + piece,
+squares numbered i*8+j as in chess_engine and stm 0 when the strong side is to move.
+Positions where the strong side is Black are mirrored top to bottom first, so the tables
+are only built with White as the strong side.
+
+Two files per table, both from the side to move's point of view:
+  <name>.wdl  2 bits per position: WDL_DRAW, WDL_WIN, WDL_LOSS or WDL_ILLEGAL
+  <name>.dtm  1 byte per position: plies to mate (odd = win, even = loss), DTM_NONE otherwise
+Build them with build_tablebase.py. This module only reads them (no engine import).
+"""
+
+import mmap
+import os
+
+MATERIALS = ("KQK", "KRK", "KPK")
+TABLE_SIZE = 2 * 64 * 64 * 64
+
+WDL_DRAW, WDL_WIN, WDL_LOSS, WDL_ILLEGAL = 0, 1, 2, 3
+DTM_NONE = 255
+
+
+def table_index(strong_to_move, strong_king, weak_king, piece):
+    return (((0 if strong_to_move else 1) * 64 + strong_king) * 64 + weak_king) * 64 + piece
+
+
+def decode_index(index):
+    """index -> (strong_to_move, strong_king, weak_king, piece)."""
+    piece = index & 63
+    weak_king = (index >> 6) & 63
+    strong_king = (index >> 12) & 63
+    return index >> 18 == 0, strong_king, weak_king, piece
+
+
+def classify(temp_board, side_to_move):
+    """
+    ('KK', None) for bare kings, (material, index) for a position one of the tables
+    covers, None for anything else. Does not check that the table is loaded.
+    """
+    kings = {}
+    extra = None
+    for i, row in enumerate(temp_board):
+        for j, p in enumerate(row):
+            if p == '  ':
+                continue
+            if p[1] == 'K':
+                kings[p[0]] = i*8 + j
+            elif extra is None:
+                extra = (p, i*8 + j)
+            else:
+                return None
+    if len(kings) != 2:
+        return None
+    if extra is None:
+        return 'KK', None
+    piece, sq = extra
+    material = 'K' + piece[1] + 'K'
+    if material not in MATERIALS:
+        return None
+    strong = piece[0]
+    weak = 'b' if strong == 'w' else 'w'
+    flip = 56 if strong == 'b' else 0
+    return material, table_index(side_to_move == strong, kings[strong] ^ flip, kings[weak] ^ flip, sq ^ flip)
+
+
+def table_paths(directory, material):
+    return os.path.join(directory, material + ".wdl"), os.path.join(directory, material + ".dtm")
+
+
+def pack_wdl(values):
+    """One WDL value per position -> bytes with 4 positions per byte."""
+    out = bytearray((len(values) + 3) // 4)
+    for index, v in enumerate(values):
+        out[index >> 2] |= v << ((index & 3) * 2)
+    return bytes(out)
+
+
+def write_table(directory, material, wdl, dtm):
+    """Write one table's .wdl (packed) and .dtm files; wdl and dtm hold one value per index."""
+    os.makedirs(directory, exist_ok=True)
+    wdl_path, dtm_path = table_paths(directory, material)
+    with open(wdl_path, "wb") as f:
+        f.write(pack_wdl(wdl))
+    with open(dtm_path, "wb") as f:
+        f.write(bytes(dtm))
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Tablebases:
+    """The tables found in a directory, memory-mapped. Missing tables are skipped."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        for material in MATERIALS:
+            wdl_path, dtm_path = table_paths(directory, material)
+            try:
+                self.tables[material] = (_map(wdl_path), _map(dtm_path))
+            except (OSError, ValueError):
+                continue
+
+    def __len__(self):
+        return len(self.tables)
+
+    def close(self):
+        for wdl, dtm in self.tables.values():
+            wdl.close()
+            dtm.close()
+        self.tables = {}
+
+    def probe(self, temp_board, side_to_move):
+        """(wdl, plies_to_mate) for the side to move, or None if not covered; plies is None for draws."""
+        found = classify(temp_board, side_to_move)
+        if found is None:
+            return None
+        material, index = found
+        if material == 'KK':
+            return WDL_DRAW, None
+        return self.probe_index(material, index)
+
+    def probe_index(self, material, index):
+        """probe() for a table index; None if the table is missing or the position illegal."""
+        if material not in self.tables:
+            return None
+        wdl_table, dtm_table = self.tables[material]
+        wdl = (wdl_table[index >> 2] >> ((index & 3) * 2)) & 3
+        if wdl == WDL_ILLEGAL:
+            return None
+        return wdl, (None if wdl == WDL_DRAW else dtm_table[index])
@@ -1,17 +1,35 @@
-import tkinter as tk
-from tkinter import messagebox
 import random
 from copy import deepcopy
-import threading
+import queue
+import os
 import time
-import sys
+
+from chess_engine import (
+    initial_board, BitboardPosition, make_move_on_board, board_key,
+    get_all_moves_for_player, is_check, find_king, choose_move, move_name,
+    TranspositionTable, PonderSearch, predicted_reply, SearchController, SEARCH_PROCESSES,
+)
+from opening_book import OpeningBook
 
 # ----------------------------
 # Config
 # ----------------------------
-HARD_TIME_LIMIT = 6.0   # seconds for Hard AI per move (increase to make it stronger)
-HARD_MAX_DEPTH = 6      # maximum depth to attempt with iterative deepening
-MEDIUM_DEPTH = 4        # medium ply depth fallback
+# Search settings (HARD_TIME_LIMIT, HARD_MAX_DEPTH, ...) live in chess_engine.
+USE_BITBOARDS = True    # end-of-turn checkmate detection runs on the bitboard backend
+AI_POLL_MS = 50         # how often the GUI checks for a finished AI move
+SHOW_SEARCH_STATS = True  # live per-depth search stats under the board (False: not collected at all)
+USE_OPENING_BOOK = True   # Medium/Hard play book moves instantly while the position is in the book
+OPENING_BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")  # see build_book.py
+GAME_CLOCK = None       # e.g. (5, 3): 5 minutes each + 3 s per move; None = untimed (Hard uses HARD_TIME_LIMIT)
+CLOCK_TICK_MS = 200     # clock display refresh
+PONDER = True           # Hard keeps thinking on White's time about White's expected reply
+                        # (in-thread on transposition_table; move searches still use the pool)
+TT_SNAPSHOT_FILE = None  # e.g. os.path.join(os.path.dirname(os.path.abspath(__file__)), "tt.bin"):
+                         # the TT is loaded from it at startup and saved to it on exit
+BOARD_CANVAS = False    # draw the board on one tk.Canvas instead of 64 buttons
+SQUARE_SIZE = 64        # pixels per square
+LIGHT_SQUARE, DARK_SQUARE, SELECTED_SQUARE = "#EEEED2", "#769656", "yellow"
+TARGET_SQUARE = "#F6F669"  # legal destinations of the selected piece (None = no target highlighting)
 # ----------------------------
 
 # --- Chess Piece Symbols ---
@@ -21,21 +39,6 @@ pieces = {
     '  ': ''
 }
 
-# --- Piece Values for AI (material) ---
-piece_values = {'P': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 1000}
-
-# --- Initial Board Setup ---
-initial_board = [
-    ['bR','bN','bB','bQ','bK','bB','bN','bR'],
-    ['bP']*8,
-    ['  ']*8,
-    ['  ']*8,
-    ['  ']*8,
-    ['  ']*8,
-    ['wP']*8,
-    ['wR','wN','wB','wQ','wK','wB','wN','wR']
-]
-
 # --- Game State ---
 board = [row[:] for row in initial_board]
 current_player = 'w'          # 'w' or 'b' (white moves first)
@@ -50,453 +53,136 @@ game_over = False
 # Castling rights: True if rook/king hasn't moved (K = kingside, Q = queenside)
 castling_rights = {'wK': True, 'wQ': True, 'bK': True, 'bQ': True}
 
-# AI run state
-ai_running = False
-ai_thread = None
-ai_abort = False
+# Legal moves of recent positions by board_key, see legal_moves()
+legal_index = {}
 
-# Transposition table (string-keyed)
-transposition_table = {}
-
-# -------------------------
-# Helpers
-# -------------------------
-def in_bounds(i,j):
-    return 0 <= i < 8 and 0 <= j < 8
-
-def find_king(player, temp_board):
-    key = player + 'K'
-    for i in range(8):
-        for j in range(8):
-            if temp_board[i][j] == key:
-                return (i,j)
-    return None
+# Game clock (only used when GAME_CLOCK is set): seconds left at the start of the current turn
+clock_remaining = {'w': 0.0, 'b': 0.0}
+turn_started = time.time()
 
-def make_move_on_board(start, end, temp_board, update_castling=True):
-    """Apply move on given board. Pawn auto-promotes to Q.
-       Handles castling rook movement if king moves two squares.
-    """
-    si,sj = start
-    ei,ej = end
-    piece = temp_board[si][sj]
-    # move piece
-    temp_board[ei][ej] = piece
-    temp_board[si][sj] = '  '
-
-    # castle handling: if king moved two squares horizontally, move rook
-    if piece != '  ' and piece[1] == 'K' and abs(sj - ej) == 2:
-        if ej > sj:
-            # kingside: rook from h-file -> f-file
-            rook_start = (si, 7)
-            rook_end = (si, ej - 1)
-        else:
-            # queenside: rook from a-file -> d-file
-            rook_start = (si, 0)
-            rook_end = (si, ej + 1)
-        rs, cs = rook_start
-        re, ce = rook_end
-        rook_piece = temp_board[rs][cs]
-        # move rook if present
-        if rook_piece != '  ' and rook_piece[1] == 'R':
-            temp_board[re][ce] = rook_piece
-            temp_board[rs][cs] = '  '
-
-    # pawn promotion
-    if piece != '  ' and piece[1] == 'P':
-        if (piece[0] == 'w' and ei == 0) or (piece[0] == 'b' and ei == 7):
-            temp_board[ei][ej] = piece[0] + 'Q'
-
-    # Optionally updating castling rights should be done externally if needed.
-    # But callers can pass update_castling=True to update rights on this board if it's the main board.
-
-# Non-recursive attack detection to prevent recursion with generate_moves
-def is_square_attacked(square, by_player, temp_board):
-    """
-    Return True if the square (i,j) is attacked by any piece of by_player.
-    Handles pawn, knight, sliding pieces and king adjacency.
-    """
-    i,j = square
-    attacker = by_player
-
-    # pawn attacks
-    if attacker == 'w':
-        # white pawn at (i+1, j±1) attacks (i,j)
-        for dj in (-1, 1):
-            pi, pj = i+1, j+dj
-            if in_bounds(pi,pj) and temp_board[pi][pj] == 'wP':
-                return True
-    else:
-        # black pawn at (i-1, j±1)
-        for dj in (-1, 1):
-            pi, pj = i-1, j+dj
-            if in_bounds(pi,pj) and temp_board[pi][pj] == 'bP':
-                return True
-
-    # knights
-    knight_moves = [(-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)]
-    for di,dj in knight_moves:
-        ni,nj = i+di, j+dj
-        if in_bounds(ni,nj) and temp_board[ni][nj] != '  ' and temp_board[ni][nj][0] == attacker and temp_board[ni][nj][1] == 'N':
-            return True
-
-    # sliding pieces (orthogonal and diagonal)
-    directions = [
-        (-1,0,('R','Q')), (1,0,('R','Q')), (0,-1,('R','Q')), (0,1,('R','Q')),
-        (-1,-1,('B','Q')), (1,1,('B','Q')), (1,-1,('B','Q')), (-1,1,('B','Q'))
-    ]
-    for di,dj,types in directions:
-        ni, nj = i+di, j+dj
-        while in_bounds(ni,nj):
-            p = temp_board[ni][nj]
-            if p == '  ':
-                ni += di; nj += dj
-                continue
-            if p[0] == attacker and p[1] in types:
-                return True
-            # blocked by any piece
-            break
-
-    # king adjacency
-    for di in (-1,0,1):
-        for dj in (-1,0,1):
-            if di==0 and dj==0: continue
-            ni,nj = i+di, j+dj
-            if in_bounds(ni,nj) and temp_board[ni][nj] != '  ' and temp_board[ni][nj][0] == attacker and temp_board[ni][nj][1] == 'K':
-                return True
-
-    return False
-
-def is_check(player, temp_board=None):
-    """True if player's king is attacked on temp_board."""
-    if temp_board is None:
-        temp_board = board
-    king_pos = find_king(player, temp_board)
-    if king_pos is None:
-        # missing king -> treat as 'in check' for search
-        return True
-    enemy = 'b' if player == 'w' else 'w'
-    return is_square_attacked(king_pos, enemy, temp_board)
-
-def generate_moves(piece, pos, temp_board=None, ignore_check=False):
-    """
-    Generate pseudo-legal moves for piece at pos on temp_board.
-    If ignore_check==False filter out moves that leave own king in check.
-    Includes castling logic for the king based on castling_rights (uses global rights).
-    """
-    if temp_board is None:
-        temp_board = board
-    i,j = pos
-    color = piece[0]
-    enemy = 'b' if color=='w' else 'w'
-    p_type = piece[1]
-    moves = []
-
-    # Pawn
-    if p_type == 'P':
-        step = -1 if color == 'w' else 1
-        start_row = 6 if color == 'w' else 1
-        # forward one
-        ni, nj = i+step, j
-        if in_bounds(ni,nj) and temp_board[ni][nj] == '  ':
-            moves.append((ni,nj))
-            # forward two
-            ni2 = i + 2*step
-            if i == start_row and in_bounds(ni2,nj) and temp_board[ni2][nj] == '  ':
-                moves.append((ni2,nj))
-        # captures
-        for dj in (-1, 1):
-            ci, cj = i + step, j + dj
-            if in_bounds(ci,cj) and temp_board[ci][cj] != '  ' and temp_board[ci][cj][0] == enemy:
-                moves.append((ci,cj))
-        # en-passant not implemented
-
-    # Knight
-    elif p_type == 'N':
-        knight_moves = [(-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)]
-        for di,dj in knight_moves:
-            ni,nj = i+di, j+dj
-            if in_bounds(ni,nj) and (temp_board[ni][nj] == '  ' or temp_board[ni][nj][0] == enemy):
-                moves.append((ni,nj))
-
-    # Bishop / Rook / Queen (sliders)
-    elif p_type in ('B','R','Q'):
-        if p_type == 'B':
-            directions = [(-1,-1),(-1,1),(1,-1),(1,1)]
-        elif p_type == 'R':
-            directions = [(-1,0),(1,0),(0,-1),(0,1)]
-        else:  # Q
-            directions = [(-1,0),(1,0),(0,-1),(0,1),(-1,-1),(-1,1),(1,-1),(1,1)]
-
-        for di,dj in directions:
-            ni,nj = i+di, j+dj
-            while in_bounds(ni,nj):
-                if temp_board[ni][nj] == '  ':
-                    moves.append((ni,nj))
-                elif temp_board[ni][nj][0] == enemy:
-                    moves.append((ni,nj))
-                    break
-                else:
-                    # own piece blocks
-                    break
-                ni += di; nj += dj
-
-    # King
-    elif p_type == 'K':
-        for di in (-1,0,1):
-            for dj in (-1,0,1):
-                if di==0 and dj==0: continue
-                ni,nj = i+di, j+dj
-                if in_bounds(ni,nj) and (temp_board[ni][nj] == '  ' or temp_board[ni][nj][0] == enemy):
-                    moves.append((ni,nj))
-
-        # Castling (king-side & queen-side) - only if rights exist and squares are clear and not in check
-        if color == 'w':
-            own_rank = 7
-            rights_k = castling_rights.get('wK', False)
-            rights_q = castling_rights.get('wQ', False)
-        else:
-            own_rank = 0
-            rights_k = castling_rights.get('bK', False)
-            rights_q = castling_rights.get('bQ', False)
-
-        # only attempt castling if king is on starting square and not currently in check
-        king_start_col = 4
-        if j == king_start_col and not is_check(color, temp_board):
-            # kingside: squares between king and rook must be empty and not attacked
-            if rights_k:
-                if temp_board[own_rank][5] == '  ' and temp_board[own_rank][6] == '  ':
-                    # check that squares the king moves through are not attacked
-                    if (not is_square_attacked((own_rank,5), enemy, temp_board) and
-                        not is_square_attacked((own_rank,6), enemy, temp_board)):
-                        # rook present at h-file?
-                        if temp_board[own_rank][7] != '  ' and temp_board[own_rank][7][1] == 'R' and temp_board[own_rank][7][0] == color:
-                            moves.append((own_rank, 6))  # kingside castle target
-            # queenside:
-            if rights_q:
-                if temp_board[own_rank][3] == '  ' and temp_board[own_rank][2] == '  ' and temp_board[own_rank][1] == '  ':
-                    if (not is_square_attacked((own_rank,3), enemy, temp_board) and
-                        not is_square_attacked((own_rank,2), enemy, temp_board)):
-                        if temp_board[own_rank][0] != '  ' and temp_board[own_rank][0][1] == 'R' and temp_board[own_rank][0][0] == color:
-                            moves.append((own_rank, 2))  # queenside castle target
-
-    # Filter illegal moves that leave own king in check
-    if not ignore_check:
-        legal = []
-        for m in moves:
-            tmp = deepcopy(temp_board)
-            make_move_on_board((i,j), m, tmp)
-            # After a castling move, ensure king isn't in check
-            if not is_check(color, tmp):
-                legal.append(m)
-        return legal
-
-    return moves
-
-def get_all_moves_for_player(temp_board, player):
-    moves = []
-    for i in range(8):
-        for j in range(8):
-            p = temp_board[i][j]
-            if p != '  ' and p[0] == player:
-                for m in generate_moves(p, (i,j), temp_board, ignore_check=False):
-                    moves.append(((i,j), m))
-    return moves
-
-def is_checkmate(player):
-    """True if player has no legal moves and is in check."""
-    moves = get_all_moves_for_player(board, player)
-    if moves:
-        return False
-    return is_check(player, board)
-
-def evaluate_board(temp_board):
-    """Smarter evaluation: material + mobility + center control + king safety."""
-    score = 0.0
-    center_squares = {(3,3), (3,4), (4,3), (4,4)}
-    for i, row in enumerate(temp_board):
-        for j, p in enumerate(row):
-            if p == '  ':
-                continue
-            base = piece_values.get(p[1], 0)
-            color_factor = 1 if p[0] == 'w' else -1
-            val = base
-
-            # central control
-            if (i, j) in center_squares:
-                val += 0.2
-
-            # mobility bonus (ignore_check to be cheaper)
-            val += 0.02 * len(generate_moves(p, (i, j), temp_board, ignore_check=True))
-
-            # king safety penalty (fewer friendly defenders near king is bad)
-            if p[1] == 'K':
-                allies_near = 0
-                for di in (-1,0,1):
-                    for dj in (-1,0,1):
-                        ni, nj = i+di, j+dj
-                        if in_bounds(ni,nj) and temp_board[ni][nj] != '  ' and temp_board[ni][nj][0] == p[0]:
-                            allies_near += 1
-                val -= (8 - allies_near) * 0.3
+# AI run state: the AI's move search and the ponder search both run on search_controller,
+# so at most one of them runs at a time and stopping it drops its result
+ai_running = False
+search_controller = None
+# finished AI moves as (generation, start, end, board_snapshot, expected_reply), handed from
+# the search thread to the Tk main loop; moves from a stopped or superseded generation are dropped
+ai_results = queue.Queue()
+# per-depth search reports (chess_engine.depth_report dicts), same hand-off as ai_results
+search_stats = queue.Queue()
+# pondering: the running PonderSearch (or None)
+ponder = None
 
-            score += color_factor * val
+# Opening book (None when disabled or the file is missing)
+book = None
 
-    return score
+# Transposition table for Medium/Hard, kept across moves and games (entries age per search)
+transposition_table = None
 
-# -------------------------
-# Minimax / negamax with alpha-beta, TT and time cutoff
-# -------------------------
-def board_key(temp_board, side_to_move):
-    # compact key for transposition table
-    return (tuple(''.join(r) for r in temp_board), side_to_move)
-
-def move_order_key(temp_board, start, end):
-    # heuristic: captures (value captured higher first), promotions, then quiet
-    si,sj = start
-    ei,ej = end
-    captured = temp_board[ei][ej]
-    cap_value = 0
-    if captured != '  ':
-        cap_value = piece_values.get(captured[1], 0)
-    moving = temp_board[si][sj]
-    prom = 1 if (moving[1]=='P' and ( (moving[0]=='w' and ei==0) or (moving[0]=='b' and ei==7))) else 0
-    return (-cap_value, -prom)
-
-def minimax_tt(temp_board, depth, alpha, beta, side_to_move, stop_time, tt):
-    """
-    Returns (score, best_move) from White's perspective (positive favors White).
-    side_to_move: 'w' or 'b'.
-    Uses simple transposition table (tt) keyed by board_key.
-    Will raise TimeoutError if time exceeded.
-    """
-    if time.time() > stop_time:
-        raise TimeoutError
-
-    key = board_key(temp_board, side_to_move)
-    if key in tt and tt[key]['depth'] >= depth:
-        return tt[key]['score'], tt[key].get('best_move', None)
-
-    moves = get_all_moves_for_player(temp_board, side_to_move)
-    if depth == 0 or not moves:
-        if not moves:
-            if is_check(side_to_move, temp_board):
-                # side_to_move is checkmated -> very bad for that side
-                score = (-9999 if side_to_move == 'w' else 9999)
-                return score, None
-            else:
-                return 0, None
-        return evaluate_board(temp_board), None
-
-    best_move = None
-    # ordering
-    moves_sorted = sorted(moves, key=lambda s: move_order_key(temp_board, s[0], s[1]))
-    if side_to_move == 'w':
-        max_eval = -99999
-        for start,end in moves_sorted:
-            if time.time() > stop_time:
-                raise TimeoutError
-            t = deepcopy(temp_board)
-            # make move (castling will be handled by make_move_on_board)
-            make_move_on_board(start, end, t)
-            # small anticipation: after making this move, look at a sample of opponent replies to penalize risky moves
-            try:
-                val, _ = minimax_tt(t, depth-1, alpha, beta, 'b', stop_time, tt)
-            except TimeoutError:
-                raise
-            # opponent response sampling (light-weight)
-            if depth <= 2 and val != 0:
-                pass  # avoid double counting at shallow levels
-            # update
-            if val > max_eval:
-                max_eval = val
-                best_move = (start, end)
-            alpha = max(alpha, val)
-            if beta <= alpha:
-                break
-        tt[key] = {'depth': depth, 'score': max_eval, 'best_move': best_move}
-        return max_eval, best_move
-    else:
-        min_eval = 99999
-        for start,end in moves_sorted:
-            if time.time() > stop_time:
-                raise TimeoutError
-            t = deepcopy(temp_board)
-            make_move_on_board(start, end, t)
-            try:
-                val, _ = minimax_tt(t, depth-1, alpha, beta, 'w', stop_time, tt)
-            except TimeoutError:
-                raise
-            if val < min_eval:
-                min_eval = val
-                best_move = (start, end)
-            beta = min(beta, val)
-            if beta <= alpha:
-                break
-        tt[key] = {'depth': depth, 'score': min_eval, 'best_move': best_move}
-        return min_eval, best_move
+# search_controller, book, transposition_table and board_bb are only created when this
+# file runs as the GUI (see the bottom): spawned search workers re-run this module's top
+# level as __mp_main__ and should pay for nothing but the engine import.
 
 # -------------------------
 # AI orchestration (threaded)
 # -------------------------
-def ai_worker(board_snapshot, difficulty, apply_callback):
+def ai_worker(board_snapshot, difficulty, rights, clock=None, tt=None, cancel=None):
     """
-    Runs in background thread. When done, calls apply_callback(start,end) via root.after.
+    Runs in background thread. Asks the engine for Black's move and returns
+    (start, end, board_snapshot, expected_reply) for queue_ai_result.
+    rights: snapshot of castling_rights taken when the search was started.
+    clock: Black's (remaining, increment) seconds when playing on a game clock.
+    tt: the game's shared TranspositionTable for Medium and for in-thread Hard
+    (SEARCH_PROCESSES == 1); None for Hard on the process pool, whose workers keep their own.
+    cancel: the search_controller token that stops this search.
     """
-    global ai_abort, transposition_table
+    reports = []
+    start, end = choose_move(board_snapshot, difficulty, rights, on_depth=depth_recorder(reports), clock=clock,
+                             tt=tt, cancel=cancel)
+    return start, end, board_snapshot, expected_reply(reports, (start, end))
+
+def ponder_worker(search, cancel):
+    """Runs in background thread while White thinks; returns the move only if the ponder was a hit."""
+    reports = []
+    if search.run(depth_recorder(reports), cancel):
+        start, end = search.best_move or (None, None)
+        return start, end, search.board, expected_reply(reports, (start, end))
+    return None
 
-    moves = get_all_moves_for_player(board_snapshot, 'b')
-    if not moves:
-        root.after(1, lambda: apply_callback(None, None, board_snapshot))
-        return
+def depth_recorder(reports):
+    """on_depth callback keeping the search's depth reports (and showing them if SHOW_SEARCH_STATS)."""
+    def on_depth(report):
+        reports.append(report)
+        if SHOW_SEARCH_STATS:
+            search_stats.put(report)
+    return on_depth
+
+def expected_reply(reports, move):
+    """White's answer to move in the deepest report's line, or None: what to ponder on when the
+       move came from the process pool, whose TTs the GUI cannot read."""
+    if reports:
+        pv = reports[-1]['pv']
+        if len(pv) > 1 and pv[0] == move:
+            return pv[1]
+    return None
 
-    # Easy: random
-    if difficulty == "Easy":
-        start,end = random.choice(moves)
-        root.after(1, lambda: apply_callback(start, end, board_snapshot))
-        return
+def queue_ai_result(generation, result):
+    """search_controller callback (search thread): hand a finished move to poll_ai_results."""
+    if result is not None:
+        ai_results.put((generation,) + result)
 
-    # Medium: prefer captures; else shallow search
-    if difficulty == "Medium":
-        capture_moves = [m for m in moves if board_snapshot[m[1][0]][m[1][1]] != '  ']
-        if capture_moves:
-            start,end = random.choice(capture_moves)
-            root.after(1, lambda: apply_callback(start, end, board_snapshot))
-            return
-        try:
-            tt = {}
-            _, best = minimax_tt(board_snapshot, MEDIUM_DEPTH, -99999, 99999, 'b', time.time()+1.0, tt)
-            if best is None:
-                start,end = random.choice(moves)
-            else:
-                start,end = best
-        except TimeoutError:
-            start,end = random.choice(moves)
-        root.after(1, lambda: apply_callback(start, end, board_snapshot))
+def start_pondering(expected=None):
+    """
+    After the AI's move: search the answer to White's expected reply until White moves.
+    expected: the reply from the move's own search line, if it had one; otherwise it is
+    looked up in transposition_table.
+    """
+    global ponder
+    if not PONDER or mode != 'AI' or ai_difficulty != 'Hard' or game_over:
         return
-
-    # Hard: iterative deepening with time limit and light anticipation
-    stop_time = time.time() + HARD_TIME_LIMIT
-    best_move_overall = None
-    tt = {}
+    predicted = expected
+    if predicted is None or predicted[1] not in legal_moves('w').get(predicted[0], ()):
+        predicted = predicted_reply(board, castling_rights, transposition_table)
+    if predicted is None:
+        return
+    search = ponder = PonderSearch(board, castling_rights, predicted, transposition_table)
+    search_controller.start(lambda cancel: ponder_worker(search, cancel), queue_ai_result)
+
+def stop_pondering():
+    """Abandon the running ponder search (its TT entries stay in transposition_table)."""
+    global ponder
+    if ponder is not None:
+        search_controller.stop()
+    ponder = None
+
+def poll_ai_results():
+    """Main-thread side of the AI queue: apply any finished move, then check again later."""
+    try:
+        while True:
+            generation, start, end, board_snapshot, expected = ai_results.get_nowait()
+            if search_controller.is_current(generation):
+                apply_ai_move(start, end, board_snapshot, expected)
+    except queue.Empty:
+        pass
+    root.after(AI_POLL_MS, poll_ai_results)
+
+def format_search_stats(report):
+    """One depth_report as two lines of text for the stats label."""
+    pv = " ".join(move_name(m) for m in report['pv'])
+    return ("depth %d   eval %+.2f   nodes %d   %d nps   TT %.0f%% full, %.0f%% hits\n%s"
+            % (report['depth'], report['score'], report['nodes'], report['nps'],
+               100 * report['tt_fill'], 100 * report['tt_hit_rate'], pv))
+
+def poll_search_stats():
+    """Main-thread side of the stats queue: show the newest report, then check again later."""
+    latest = None
     try:
-        for depth in range(1, HARD_MAX_DEPTH+1):
-            if ai_abort:
-                break
-            if time.time() > stop_time:
-                break
-            try:
-                score, best = minimax_tt(board_snapshot, depth, -99999, 99999, 'b', stop_time, tt)
-                if best:
-                    best_move_overall = best
-                # continue deeper if time remains
-            except TimeoutError:
-                break
-    except Exception as e:
-        print("AI worker unexpected exception:", e, file=sys.stderr)
-
-    if best_move_overall is None:
-        best_move_overall = random.choice(moves)
-    start,end = best_move_overall
-    root.after(1, lambda: apply_callback(start, end, board_snapshot))
+        while True:
+            latest = search_stats.get_nowait()
+    except queue.Empty:
+        pass
+    if latest is not None:
+        stats_var.set(format_search_stats(latest))
+    root.after(AI_POLL_MS, poll_search_stats)
 
 # -------------------------
 # GUI & gameplay functions
@@ -548,16 +234,16 @@ def move_piece(start, end):
 
     # pawn promotion handled inside make_move_on_board
 
-def apply_ai_move(start, end, board_snapshot):
+def apply_ai_move(start, end, board_snapshot, expected=None):
     """
     Runs on main thread. Applies the provided move (computed on snapshot).
+    expected: White's reply the search expects (see start_pondering).
     """
-    global game_over, ai_running, ai_abort
+    global game_over, ai_running
     ai_running = False
-    ai_abort = False
 
     if start is None or end is None:
-        if is_check('b'):
+        if is_check('b', board):
             messagebox.showinfo("Checkmate", "White wins!")
         else:
             messagebox.showinfo("Stalemate", "Draw by stalemate.")
@@ -565,43 +251,97 @@ def apply_ai_move(start, end, board_snapshot):
         return
 
     # Sanity: verify move still legal on current board; if not, pick random legal
-    legal_moves = get_all_moves_for_player(board, 'b')
-    if ((start,end) not in legal_moves):
-        if not legal_moves:
-            if is_check('b'):
+    legal = legal_moves('b')
+    if end not in legal.get(start, ()):
+        if not legal:
+            if is_check('b', board):
                 messagebox.showinfo("Checkmate", "White wins!")
             else:
                 messagebox.showinfo("Stalemate", "Draw by stalemate.")
             game_over = True
             return
-        start,end = random.choice(legal_moves)
+        start,end = random.choice([(s, e) for s, ends in legal.items() for e in ends])
+        expected = None
 
     move_piece(start, end)
     update_board()
 
-    if is_checkmate('w'):
+    if player_is_checkmated('w'):
         messagebox.showinfo("Checkmate", "AI wins!")
         game_over = True
         return
 
     switch_player()
+    start_pondering(expected)
+
+def legal_moves(player=None):
+    """
+    {start: [end, ...]} of player's (default: side to move) legal moves in the live game.
+    Generated once per position (on the bitboard mirror when USE_BITBOARDS) and kept under
+    its board_key, so clicks, target highlighting, the castle buttons, mate detection and
+    the AI's sanity check all share one generation.
+    """
+    if player is None:
+        player = current_player
+    key = board_key(board, player, castling_rights)
+    index = legal_index.get(key)
+    if index is None:
+        if USE_BITBOARDS:
+            board_bb.load(board)
+            board_bb.rights = castling_rights
+        index = {}
+        for start, end in get_all_moves_for_player(board_bb if USE_BITBOARDS else board, player, castling_rights):
+            index.setdefault(start, []).append(end)
+        if len(legal_index) >= 4:   # only the last few positions are ever asked for again
+            legal_index.clear()
+        legal_index[key] = index
+    return index
+
+def player_is_checkmated(player):
+    """True if player is mated in the live game (see legal_moves)."""
+    return not legal_moves(player) and is_check(player, board)
 
 def start_ai_thread():
     """Start background AI worker if not already running."""
-    global ai_running, ai_thread, ai_abort
+    global ai_running, ponder
     if ai_running or game_over:
         return
+    clock = (time_left('b'), GAME_CLOCK[1]) if GAME_CLOCK else None
+    if ponder is not None:
+        if ponder.matches(board, castling_rights):
+            # ponder hit: the background search becomes this move's search
+            search, ponder = ponder, None
+            ai_running = True
+            if search.hit(clock):
+                start, end = search.best_move or (None, None)
+                apply_ai_move(start, end, board)
+            return
+        stop_pondering()
+    # book hit: answer on the main thread without starting a search
+    if book is not None and ai_difficulty != "Easy":
+        move = book.choose(board, 'b', castling_rights)
+        if move is not None:
+            apply_ai_move(move[0], move[1], board)
+            return
     ai_running = True
-    ai_abort = False
     board_snapshot = deepcopy(board)
+    rights_snapshot = dict(castling_rights)
     difficulty = ai_difficulty
-    def target():
-        ai_worker(board_snapshot, difficulty, apply_ai_move)
-    ai_thread = threading.Thread(target=target, daemon=True)
-    ai_thread.start()
+    # Hard on the process pool keeps a TT in each worker process instead (then only
+    # pondering uses transposition_table)
+    tt = None
+    if difficulty == 'Medium' or (difficulty == 'Hard' and SEARCH_PROCESSES == 1):
+        tt = transposition_table
+    search_controller.start(lambda cancel: ai_worker(board_snapshot, difficulty, rights_snapshot, clock, tt, cancel),
+                            queue_ai_result)
 
 def switch_player():
-    global current_player, player_view_flipped, ai_abort
+    global current_player, player_view_flipped, turn_started
+    if GAME_CLOCK:
+        # charge the move to the side that just played, then add its increment
+        now = time.time()
+        clock_remaining[current_player] += GAME_CLOCK[1] - (now - turn_started)
+        turn_started = now
     current_player = 'b' if current_player == 'w' else 'w'
     # flip view only if user toggles option
     if flip_var.get():
@@ -611,48 +351,138 @@ def switch_player():
     if mode == 'AI' and current_player == 'b' and not game_over:
         root.after(120, start_ai_thread)
 
+def reset_clocks():
+    global turn_started
+    if GAME_CLOCK:
+        clock_remaining['w'] = clock_remaining['b'] = GAME_CLOCK[0] * 60.0
+    turn_started = time.time()
+
+def time_left(player):
+    """Seconds on player's clock right now (the side to move is running down)."""
+    if player == current_player and not game_over:
+        return clock_remaining[player] - (time.time() - turn_started)
+    return clock_remaining[player]
+
+def update_clocks():
+    """Redraw the clocks and end the game when the side to move runs out of time."""
+    global game_over, ponder
+    def fmt(seconds):
+        seconds = max(0, int(seconds))
+        return "%d:%02d" % (seconds // 60, seconds % 60)
+    clock_var.set("White %s     Black %s" % (fmt(time_left('w')), fmt(time_left('b'))))
+    if not game_over and time_left(current_player) <= 0:
+        clock_remaining[current_player] = 0.0
+        game_over = True
+        search_controller.stop()
+        ponder = None
+        update_board()
+        messagebox.showinfo("Time", ("White" if current_player == 'w' else "Black") + " lost on time.")
+    root.after(CLOCK_TICK_MS, update_clocks)
+
 # -------------------------
 # Tkinter UI
 # -------------------------
-root = tk.Tk()
-root.title("Chess Game")
-root.geometry("640x700")
-root.resizable(False, False)
+class ButtonBoard:
+    """The board as an 8x8 grid of tk.Buttons; draw() reconfigures only the squares that changed."""
+
+    def __init__(self, parent, on_square):
+        self.drawn = [None] * 64
+        self.buttons = []
+        for i in range(8):
+            for j in range(8):
+                btn = tk.Button(parent, text=" ", font=("Arial", 28), command=lambda i=i, j=j: on_square(i, j))
+                btn.grid(row=i, column=j, sticky='nsew', padx=0, pady=0)
+                self.buttons.append(btn)
+        # fixed square size, so empty columns never shrink
+        for i in range(8):
+            parent.rowconfigure(i, minsize=SQUARE_SIZE, weight=1)
+            parent.columnconfigure(i, minsize=SQUARE_SIZE, weight=1)
+
+    def draw(self, squares):
+        """squares: 64 (symbol, color) pairs in display order."""
+        for sq, square in enumerate(squares):
+            if square != self.drawn[sq]:
+                self.drawn[sq] = square
+                symbol, color = square
+                # a space keeps Tkinter from collapsing an empty button
+                self.buttons[sq].config(text=symbol or " ", bg=color, activebackground=color)
+
+class CanvasBoard:
+    """The board on a single tk.Canvas: one rectangle and one text item per square, created
+       once and reconfigured (only where something changed) by draw()."""
+
+    def __init__(self, parent, on_square):
+        self.drawn = [None] * 64
+        self.canvas = tk.Canvas(parent, width=8 * SQUARE_SIZE, height=8 * SQUARE_SIZE, highlightthickness=0)
+        self.canvas.pack(expand=True)
+        self.items = []
+        for i in range(8):
+            for j in range(8):
+                x, y = j * SQUARE_SIZE, i * SQUARE_SIZE
+                rect = self.canvas.create_rectangle(x, y, x + SQUARE_SIZE, y + SQUARE_SIZE, width=0)
+                text = self.canvas.create_text(x + SQUARE_SIZE // 2, y + SQUARE_SIZE // 2, text="",
+                                               font=("Arial", 36))
+                self.items.append((rect, text))
+        def click(event):
+            i, j = event.y // SQUARE_SIZE, event.x // SQUARE_SIZE
+            if 0 <= i < 8 and 0 <= j < 8:
+                on_square(i, j)
+        self.canvas.bind("<Button-1>", click)
+
+    def draw(self, squares):
+        """squares: 64 (symbol, color) pairs in display order."""
+        for sq, square in enumerate(squares):
+            old = self.drawn[sq]
+            if square == old:
+                continue
+            self.drawn[sq] = square
+            rect, text = self.items[sq]
+            if old is None or old[0] != square[0]:
+                self.canvas.itemconfigure(text, text=square[0])
+            if old is None or old[1] != square[1]:
+                self.canvas.itemconfigure(rect, fill=square[1])
 
-frame = tk.Frame(root)
-frame.pack(expand=True, fill='both', padx=8, pady=8)
+board_view = None        # ButtonBoard or CanvasBoard, created with the window
+redraw_scheduled = False
 
-buttons = [[None for _ in range(8)] for _ in range(8)]
+# bitboard mirror of `board`, refreshed on every update_board()
+board_bb = None
 
 def update_board():
-    """Safely redraw all pieces on the board without collapsing columns."""
-    global buttons
-
+    """Sync board_bb now and schedule one redraw for when Tk is next idle; any further
+       calls before then share that redraw."""
+    global redraw_scheduled
+    # sync the bitboard backend (redraw_board draws from it)
+    board_bb.load(board)
+    board_bb.rights = castling_rights
+    if not redraw_scheduled:
+        redraw_scheduled = True
+        root.after_idle(redraw_board)
+
+def redraw_board():
+    """Draw the board from board_bb's conversion back to a list board, plus the castle buttons."""
+    global redraw_scheduled
+    redraw_scheduled = False
+    drawn = board_bb.to_board()
+    highlight = {}
+    if selected_piece:
+        # highlights are on display coordinates, as on_click maps them
+        to_display = (lambda r, c: (7 - r, 7 - c)) if player_view_flipped else (lambda r, c: (r, c))
+        if TARGET_SQUARE:
+            for target in legal_moves().get(selected_coords, ()):
+                highlight[to_display(*target)] = TARGET_SQUARE
+        highlight[to_display(*selected_coords)] = SELECTED_SQUARE
+    squares = []
     for r in range(8):
         for c in range(8):
-            piece = board[r][c]
-            button = buttons[r][c]
-
-            # Always display something so Tkinter keeps column width stable
-            display_symbol = pieces.get(piece, " ")
-            if display_symbol == " ":
-                # Use a transparent placeholder (like a non-breaking space)
-                button.config(text=" ")  # U+00A0 non-breaking space
+            if (r, c) in highlight:
+                color = highlight[r, c]
             else:
-                button.config(text=display_symbol)
-
-            # Color squares consistently
-            color = "#EEEED2" if (r + c) % 2 == 0 else "#769656"
-            button.config(bg=color, activebackground=color)
-
-    # Lock column widths so they never shrink
-    for c in range(8):
-        root.grid_columnconfigure(c, minsize=64, weight=1)
-    for r in range(8):
-        root.grid_rowconfigure(r, minsize=64, weight=1)
+                color = LIGHT_SQUARE if (r + c) % 2 == 0 else DARK_SQUARE
+            squares.append((pieces.get(drawn[r][c], ""), color))
+    board_view.draw(squares)
+    update_castle_buttons()
 
-    root.update_idletasks()
-    
 def on_click(i, j):
     global selected_piece, selected_coords, current_player, game_over
     if game_over or (mode == 'AI' and current_player == 'b') or ai_running:
@@ -664,15 +494,15 @@ def on_click(i, j):
     piece = board[ri][rj]
 
     if selected_piece:
-        legal = generate_moves(selected_piece, selected_coords, None, ignore_check=False)
-        if (ri, rj) in legal:
+        if (ri, rj) in legal_moves().get(selected_coords, ()):
             # perform move; if castling occurs, move_piece will handle rook
             move_piece(selected_coords, (ri, rj))
             update_board()
             # check for checkmate/stalemate
-            if is_checkmate('b' if current_player=='w' else 'w'):
+            if player_is_checkmated('b' if current_player=='w' else 'w'):
                 messagebox.showinfo("Checkmate", f"{current_player.upper()} wins!")
                 game_over = True
+                stop_pondering()
                 selected_piece = None
                 selected_coords = None
                 return
@@ -686,37 +516,7 @@ def on_click(i, j):
         if piece != '  ' and piece[0] == current_player:
             selected_piece = piece
             selected_coords = (ri, rj)
-            # highlight selection (map back to display coords)
-            di,dj = (7-selected_coords[0], 7-selected_coords[1]) if player_view_flipped else selected_coords
-            try:
-                buttons[di][dj].config(bg='yellow')
-            except Exception:
-                pass
-
-# create board buttons
-for i in range(8):
-    for j in range(8):
-        bg = 'white' if (i + j) % 2 == 0 else 'gray'
-        btn = tk.Button(
-            frame,
-            text=pieces.get(board[i][j], ""),
-            font=("Arial", 28),
-            bg=bg,
-            command=lambda i=i, j=j: on_click(i, j)
-        )
-        btn.grid(row=i, column=j, sticky='nsew', padx=0, pady=0)
-        buttons[i][j] = btn
-
-for i in range(8):
-    frame.rowconfigure(i, weight=1)
-    frame.columnconfigure(i, weight=1)
-
-# Menu
-menu = tk.Menu(root)
-root.config(menu=menu)
-game_menu = tk.Menu(menu, tearoff=0)
-menu.add_cascade(label="Game", menu=game_menu)
-flip_var = tk.BooleanVar(value=True)
+            update_board()   # highlights the selection and its targets
 
 def set_mode_2p():
     global mode
@@ -730,11 +530,12 @@ def set_mode_ai():
 
 def set_difficulty(level):
     global ai_difficulty
+    stop_pondering()
     ai_difficulty = level
     messagebox.showinfo("AI Difficulty", f"Difficulty set to {level}")
 
 def reset_game():
-    global board, current_player, player_view_flipped, king_positions, game_over, selected_piece, selected_coords, ai_running, ai_abort, transposition_table, castling_rights
+    global board, current_player, player_view_flipped, king_positions, game_over, selected_piece, selected_coords, ai_running, ponder, castling_rights
     board[:] = [row[:] for row in initial_board]
     current_player = 'w'
     player_view_flipped = False
@@ -743,38 +544,26 @@ def reset_game():
     selected_piece = None
     selected_coords = None
     ai_running = False
-    ai_abort = True
-    transposition_table = {}
+    search_controller.stop()
+    ponder = None
     # reset castling rights
     castling_rights = {'wK': True, 'wQ': True, 'bK': True, 'bQ': True}
+    reset_clocks()
     update_board()
     # if vs AI and black to move (shouldn't be), schedule AI
     if mode == 'AI' and current_player == 'b':
         root.after(120, start_ai_thread)
 
-game_menu.add_command(label="2 Players", command=set_mode_2p)
-game_menu.add_command(label="Vs AI", command=set_mode_ai)
-game_menu.add_checkbutton(label="Flip Board", variable=flip_var)
-game_menu.add_command(label="Reset Game", command=reset_game)
-
-ai_menu = tk.Menu(menu, tearoff=0)
-menu.add_cascade(label="AI Difficulty", menu=ai_menu)
-for diff in ["Easy","Medium","Hard"]:
-    ai_menu.add_command(label=diff, command=lambda d=diff:set_difficulty(d))
-
-# show current defaults
-update_board()
-
-# If default mode is AI and human is white, nothing to do.
-# If you want AI to start as white, set current_player = 'b' and call start_ai_thread() after mainloop starts.
-# --- ADD THIS SECTION near the bottom, just before root.mainloop() ---
+def on_close():
+    """Window closed: stop background searches, save the TT snapshot if configured, quit."""
+    search_controller.stop(timeout=1.0)
+    if TT_SNAPSHOT_FILE:
+        transposition_table.save(TT_SNAPSHOT_FILE)
+    root.destroy()
 
 # -------------------------
 # CASTLING BUTTONS
 # -------------------------
-castle_frame = tk.Frame(root)
-castle_frame.pack(pady=10)
-
 def attempt_castle(side):
     """Try to perform castling for the current player manually via button."""
     global board, current_player
@@ -789,39 +578,99 @@ def attempt_castle(side):
         target = (own_rank, 2)
 
     king_pos = find_king(color, board)
-    legal = generate_moves(color + 'K', king_pos, board)
-    if target in legal:
+    if target in legal_moves(color).get(king_pos, ()):
         move_piece(king_pos, target)
         update_board()
         switch_player()
     else:
         messagebox.showinfo("Castling", f"{color.upper()} cannot castle {('kingside' if side=='K' else 'queenside')} now.")
 
-castle_k_btn = tk.Button(castle_frame, text="Castle Queenside", font=("Arial", 12), command=lambda: attempt_castle('Q'))
-castle_q_btn = tk.Button(castle_frame, text="Castle Kingside", font=("Arial", 12), command=lambda: attempt_castle('K'))
-castle_k_btn.pack(side="left", padx=8)
-castle_q_btn.pack(side="left", padx=8)
-
 def update_castle_buttons():
-    """Enable/disable castling buttons based on turn."""
-    if game_over:
+    """Enable each castling button only while the side to move can castle that way."""
+    if game_over or (mode == 'AI' and current_player == 'b'):
         castle_k_btn.config(state='disabled')
         castle_q_btn.config(state='disabled')
         return
-    if mode == 'AI' and current_player == 'b':
-        castle_k_btn.config(state='disabled')
-        castle_q_btn.config(state='disabled')
-    else:
-        castle_k_btn.config(state='normal')
-        castle_q_btn.config(state='normal')
-
-# hook it into your board update
-old_update_board = update_board
-def update_board_with_castle():
-    old_update_board()
-    update_castle_buttons()
+    rank = 7 if current_player == 'w' else 0
+    king_moves = legal_moves().get((rank, 4), ()) if board[rank][4] == current_player + 'K' else ()
+    # castle_k_btn is the "Castle Queenside" button, castle_q_btn the kingside one
+    castle_k_btn.config(state='normal' if (rank, 2) in king_moves else 'disabled')
+    castle_q_btn.config(state='normal' if (rank, 6) in king_moves else 'disabled')
 
-update_board = update_board_with_castle
-update_board()
+# -------------------------
+# Window setup and GUI state (only when run as a script, so importing this module or
+# spawning search workers never opens a window or builds the tables)
+# -------------------------
+if __name__ == "__main__":
+    import tkinter as tk
+    from tkinter import messagebox
+
+    search_controller = SearchController()
+    transposition_table = TranspositionTable()
+    board_bb = BitboardPosition(board)
+    if USE_OPENING_BOOK:
+        try:
+            book = OpeningBook(OPENING_BOOK_FILE)
+        except OSError:
+            book = None
+
+    root = tk.Tk()
+    root.title("Chess Game")
+    root.geometry("640x700")
+    root.resizable(False, False)
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    if TT_SNAPSHOT_FILE:
+        transposition_table.load(TT_SNAPSHOT_FILE)
+
+    frame = tk.Frame(root)
+    frame.pack(expand=True, fill='both', padx=8, pady=8)
+
+    # board squares (grid and item setup happens once, here)
+    board_view = (CanvasBoard if BOARD_CANVAS else ButtonBoard)(frame, on_click)
+
+    # Menu
+    menu = tk.Menu(root)
+    root.config(menu=menu)
+    game_menu = tk.Menu(menu, tearoff=0)
+    menu.add_cascade(label="Game", menu=game_menu)
+    flip_var = tk.BooleanVar(value=True)
+
+    game_menu.add_command(label="2 Players", command=set_mode_2p)
+    game_menu.add_command(label="Vs AI", command=set_mode_ai)
+    game_menu.add_checkbutton(label="Flip Board", variable=flip_var)
+    game_menu.add_command(label="Reset Game", command=reset_game)
+
+    ai_menu = tk.Menu(menu, tearoff=0)
+    menu.add_cascade(label="AI Difficulty", menu=ai_menu)
+    for diff in ["Easy","Medium","Hard"]:
+        ai_menu.add_command(label=diff, command=lambda d=diff:set_difficulty(d))
+
+    castle_frame = tk.Frame(root)
+    castle_frame.pack(pady=10)
+    castle_k_btn = tk.Button(castle_frame, text="Castle Queenside", font=("Arial", 12), command=lambda: attempt_castle('Q'))
+    castle_q_btn = tk.Button(castle_frame, text="Castle Kingside", font=("Arial", 12), command=lambda: attempt_castle('K'))
+    castle_k_btn.pack(side="left", padx=8)
+    castle_q_btn.pack(side="left", padx=8)
+
+    if GAME_CLOCK:
+        clock_var = tk.StringVar(value="")
+        tk.Label(root, textvariable=clock_var, font=("Arial", 14)).pack(pady=(0, 6))
+
+    if SHOW_SEARCH_STATS:
+        # eval is from White's point of view; the line starts with Black's move
+        stats_var = tk.StringVar(value="")
+        stats_label = tk.Label(root, textvariable=stats_var, font=("Courier", 10), justify="left", anchor="w")
+        stats_label.pack(fill='x', padx=8, pady=(0, 6))
+
+    # show current defaults
+    update_board()
 
-root.mainloop()
+    # If default mode is AI and human is white, nothing to do.
+    # If you want AI to start as white, set current_player = 'b' and call start_ai_thread() after mainloop starts.
+    poll_ai_results()
+    if SHOW_SEARCH_STATS:
+        poll_search_stats()
+    if GAME_CLOCK:
+        reset_clocks()
+        update_clocks()
+    root.mainloop()